@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+
+"""Lodestone benchmark
+
+Records Lodestone pages once, then replays them through a fixture transport so
+scrape_* parse speed can be compared with no network.
+
+Usage:
+  bench.py record <fixtures> [--character=<id>...] [--free-company=<id>...] [--topics]
+  bench.py run <fixtures> [--iterations=<n>] [--parser=<parser>]
+
+Options:
+  -h --help             Show this screen.
+  --iterations=<n>      Times each recorded call is replayed [default: 10].
+  --parser=<parser>     bs4 parser, defaults to the scraper's own default.
+"""
+
+from __future__ import print_function, division
+import sys
+import os
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from docopt import docopt
+import hashlib
+import json
+import time
+
+import requests
+from requests.adapters import BaseAdapter
+
+from ffxivscraper import FFXIvScraper, CHARACTER_SECTIONS
+from ffxivscraper.metrics import MemoryMetrics
+
+try:
+    import tracemalloc
+except ImportError:  # Python 2, fall back to the process high-water mark
+    tracemalloc = None
+    import resource
+
+MANIFEST = 'manifest.json'
+
+
+class FixtureAdapter(BaseAdapter):
+    # Serves recorded pages in place of Lodestone, unknown URLs are a 404
+    def __init__(self, fixtures):
+        super(FixtureAdapter, self).__init__()
+        with open(os.path.join(fixtures, MANIFEST)) as f:
+            self.pages = json.load(f)['pages']
+        self.bodies = {}
+        for url, page in self.pages.items():
+            with open(os.path.join(fixtures, page['file']), 'rb') as f:
+                self.bodies[url] = f.read()
+        self.served = 0
+
+    def send(self, request, **kwargs):
+        self.served += 1
+        r = requests.Response()
+        r.url = request.url
+        r.request = request
+        page = self.pages.get(request.url)
+        if page is None:
+            r.status_code = 404
+            r._content = b''
+        else:
+            r.status_code = page['status']
+            r._content = self.bodies[request.url]
+        return r
+
+    def close(self):
+        pass
+
+
+def record(fixtures, calls):
+    if not os.path.isdir(fixtures):
+        os.makedirs(fixtures)
+
+    pages = {}
+
+    def save(r, *args, **kwargs):
+        if r.is_redirect:
+            return
+        # Keyed by the URL the scraper asked for, so replays don't depend on redirects
+        url = r.history[0].url if r.history else r.url
+        name = hashlib.sha1(url.encode('utf-8')).hexdigest() + '.html'
+        with open(os.path.join(fixtures, name), 'wb') as f:
+            f.write(r.content)
+        pages[url] = {'file': name, 'status': r.status_code}
+
+    s = FFXIvScraper()
+    s.s.hooks['response'].append(save)
+    for method, args in calls:
+        print('recording %s%r' % (method, tuple(args)))
+        getattr(s, method)(*args)
+
+    with open(os.path.join(fixtures, MANIFEST), 'w') as f:
+        json.dump({'pages': pages, 'calls': calls}, f, indent=4)
+    print('%d pages saved to %s' % (len(pages), fixtures))
+
+
+def scraper_for(fixtures, parser, metrics=None):
+    s = FFXIvScraper(parser=parser, retries=0, metrics=metrics)
+    adapter = FixtureAdapter(fixtures)
+    s.s.mount('http://', adapter)
+    s.s.mount('https://', adapter)
+    return s, adapter
+
+
+def peak_memory(fixtures, parser, method, args):
+    s, _ = scraper_for(fixtures, parser)
+    if tracemalloc is None:
+        getattr(s, method)(*args)
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    tracemalloc.start()
+    try:
+        getattr(s, method)(*args)
+        return tracemalloc.get_traced_memory()[1] // 1024
+    finally:
+        tracemalloc.stop()
+
+
+def run(fixtures, iterations, parser):
+    with open(os.path.join(fixtures, MANIFEST)) as f:
+        calls = json.load(f)['calls']
+
+    for method, args in calls:
+        s, adapter = scraper_for(fixtures, parser, MemoryMetrics())
+        getattr(s, method)(*args)  # warm up
+        s.metrics = MemoryMetrics()
+        adapter.served = 0
+
+        started = time.time()
+        for _ in range(iterations):
+            getattr(s, method)(*args)
+        elapsed = time.time() - started
+
+        print('%s%r' % (method, tuple(args)))
+        print('  %.1f pages/sec, %.2f ms/call, %d pages/call' % (
+            adapter.served / elapsed, elapsed * 1000 / iterations, adapter.served // iterations))
+        # parse.* steps, parse.character.* sections nest inside parse.character
+        steps = [(name, timing) for name, timing in s.metrics.summary().items() if name.startswith('parse.')]
+        for name, timing in sorted(steps, key=lambda step: -step[1]['total']):
+            print('  %-30s %8.2f ms/call' % (name, timing['total'] * 1000 / iterations))
+        print('  peak memory %d KB%s' % (peak_memory(fixtures, parser, method, args),
+                                         '' if tracemalloc else ' (process max RSS)'))
+
+
+if __name__ == '__main__':
+    a = docopt(__doc__)
+
+    if a['record']:
+        calls = [('scrape_character', [lodestone_id, list(CHARACTER_SECTIONS)]) for lodestone_id in a['--character']]
+        calls += [('scrape_free_company', [lodestone_id]) for lodestone_id in a['--free-company']]
+        if a['--topics']:
+            calls.append(('scrape_topics', []))
+        record(a['<fixtures>'], calls)
+
+    if a['run']:
+        run(a['<fixtures>'], int(a['--iterations']), a['--parser'])
@@ -1,9 +1,38 @@
+from __future__ import print_function
 from werkzeug.urls import url_quote_plus
-from gevent.pool import Pool
+from ffxivscraper.metrics import NULL_TIMER, Timer, timed
+from collections import OrderedDict
 import bs4
 import re
 import requests
 import math
+import copy
+import hashlib
+import logging
+import random
+import time
+
+try:
+    unicode
+except NameError:  # Python 3
+    unicode = str
+    xrange = range
+
+# lxml's C parser is several times faster, so it's used whenever it's installed
+# (tests/test_parsers.py checks both give identical results)
+try:
+    import lxml
+    DEFAULT_PARSER = 'lxml'
+except ImportError:
+    DEFAULT_PARSER = 'html.parser'
+
+log = logging.getLogger(__name__)
+
+# (connect, read) seconds, so a hung socket can't stall a greenlet forever
+DEFAULT_TIMEOUT = (10, 30)
+
+# Transient responses worth another try, everything else is returned as-is
+RETRY_STATUSES = (429, 500, 502, 503, 504)
 
 FFXIV_ELEMENTS = ['fire', 'ice', 'wind', 'earth', 'lightning', 'water']
 
@@ -15,13 +44,42 @@ FFXIV_PROPS = ['Defense', 'Parry', 'Magic Defense',
                'Accuracy', 'Critical Hit Rate', 'Determination',
                'Craftsmanship', 'Control']
 
+# Lodestone serves this instead of a 404 for free companies that don't exist
+FREE_COMPANY_MISSING = b'The page you are searching for has either been removed,'
+
+# Optional parts of scrape_character; pass a subset as include= to skip the rest
+CHARACTER_SECTIONS = ('classes', 'stats', 'achievements', 'minions', 'mounts', 'current_equipment')
+
+# Everything scrape_character looks up across the whole character page, see index_tree
+CHARACTER_SELECTORS = ['a.frame__chara__link', 'p.frame__chara__name', 'p.frame__chara__world',
+                       'p.frame__chara__title', 'div.frame__chara__face', 'div.character__detail__image',
+                       'div.character__freecompany__name', 'div.character__freecompany__crest__image',
+                       'ul.character__job', 'table.character__param__list',
+                       'p.character__param__text__hp--en-us', 'p.character__param__text__mp--en-us',
+                       'p.character__param__text__tp--en-us',
+                       'div.character__mounts', 'div.character__minion',
+                       '.ic_reflection_box', '.item_name_right', '.bt_legacy_history']
+
+CHARACTER_LABELS = ['Race/Clan/Gender', 'Nameday', 'City-state', 'Grand Company']
+
+CHARACTER_TOOLTIPS = ['Decreases %s-aspected damage.' % element for element in FFXIV_ELEMENTS]
+
+# verify_character only reads these blocks of the character page, the rest is never built
+VERIFICATION_STRAINER = bs4.SoupStrainer(class_=['player_name_txt', 'txt_selfintroduction'])
+
+
 def debug_print(field, value):
     debug = 0
     if debug:
         if value:
-            print field.upper() + " :: " + value
+            print(field.upper() + " :: " + value)
         else:
-            print "NO VALUE FOR: " + field
+            print("NO VALUE FOR: " + field)
+
+
+def to_str(node):
+    # utf-8 bytes on Python 2 like this module has always returned, text on Python 3
+    return node.encode('utf-8') if str is bytes else unicode(node)
 
 
 def strip_tags(html, invalid_tags):
@@ -41,38 +99,273 @@ def strip_tags(html, invalid_tags):
     return soup
 
 
+def index_tree(soup, selectors=(), texts=(), tooltips=()):
+    # Walks the document once and buckets every node a page extractor needs, instead of
+    # a full-tree select()/find() per field. Selectors are simple 'tag.class' or '.class'
+    # strings, texts match whole strings like find(text=...) and tooltips match the
+    # data-tooltip attribute. Each key maps to its matches in document order.
+    found = dict((key, []) for key in selectors)
+    strings = dict((text, []) for text in texts)
+    tips = dict((tooltip, []) for tooltip in tooltips)
+
+    for node in soup.descendants:
+        if isinstance(node, bs4.NavigableString):
+            if node in strings:
+                strings[node].append(node)
+            continue
+
+        for cls in node.get('class') or ():
+            key = '.' + cls
+            if key in found:
+                found[key].append(node)
+            key = node.name + key
+            if key in found:
+                found[key].append(node)
+
+        tooltip = node.get('data-tooltip')
+        if tooltip in tips:
+            tips[tooltip].append(node)
+
+    found.update(strings)
+    found.update(tips)
+    return found
+
+
 class DoesNotExist(Exception):
     pass
 
 
-class Scraper(object):
-    def __init__(self):
+class BaseScraper(object):
+    # Settings, retry policy and parsing shared by the gevent based Scraper and
+    # ffxivscraper.aio.AsyncScraper; subclasses add the HTTP client
+    def __init__(self, parser=None, cache=None, parse_cache=None, name_cache=None, throttle=None,
+                 timeout=DEFAULT_TIMEOUT, retries=3, backoff=0.5, backoff_max=30, pool_size=10,
+                 page_concurrency=5, metrics=None):
+        # Default concurrency of the bulk methods (scrape_characters and friends)
+        self.pool_size = pool_size
+        # Pages of one character's achievements or one FC's roster fetched at once
+        self.page_concurrency = page_concurrency
+        # Requests in flight at once when pool_size characters each fetch their pages
+        self.connections = pool_size * (1 + page_concurrency)
+
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+
+        self.parser = parser or DEFAULT_PARSER
+        # Optional cache.ResponseCache, make_request bypasses it when None
+        self.cache = cache
+        # Optional cache.MemoryCache/SQLiteCache of parsed pages, see parse_page
+        self.parse_cache = parse_cache
+        # Optional cache.NameCache, see validate_character
+        self.name_cache = name_cache
+        # Optional throttle.Throttle shared by every request, see send
+        self.throttle = throttle
+        # Optional metrics.Metrics sink, instrumentation is a no-op when None
+        self.metrics = metrics
+
+    def timer(self, name):
+        return NULL_TIMER if self.metrics is None else Timer(self.metrics, name)
+
+    def count(self, name, value=1):
+        if self.metrics is not None:
+            self.metrics.incr(name, value)
+
+    def record_response(self, status_code, elapsed):
+        if self.metrics is not None:
+            self.metrics.timing('http.request', elapsed)
+            self.metrics.incr('http.status.%s' % status_code)
+
+    def retry_delay(self, attempt, r=None):
+        delay = random.uniform(0, min(self.backoff_max, self.backoff * 2 ** attempt))
+        retry_after = r.headers.get('Retry-After', '') if r is not None else ''
+        if retry_after.isdigit():
+            delay = max(delay, min(self.backoff_max, int(retry_after)))
+        return delay
+
+    def make_soup(self, html, parse_only=None):
+        with self.timer('parse.soup'):
+            return bs4.BeautifulSoup(html, self.parser, parse_only=parse_only)
+
+    def parse_page(self, key, html, parse):
+        # Returns parse(soup). With a parse_cache the result is remembered under key next
+        # to a digest of html, and while the page stays byte-identical it's handed back
+        # without building a soup at all.
+        name = 'parse.' + key.split(':', 1)[0]
+
+        if self.parse_cache is None:
+            soup = self.make_soup(html)
+            with self.timer(name):
+                return parse(soup)
+
+        digest = hashlib.sha1(html).hexdigest()
+        cached = self.parse_cache.get(key)
+        if cached is not None and cached[0] == digest:
+            self.count('parse_cache.hit')
+            return copy.deepcopy(cached[1])
+        self.count('parse_cache.miss')
+
+        soup = self.make_soup(html)
+        with self.timer(name):
+            result = parse(soup)
+        self.parse_cache.set(key, (digest, copy.deepcopy(result)))
+        return result
+
+
+class Scraper(BaseScraper):
+    def __init__(self, **kwargs):
+        super(Scraper, self).__init__(**kwargs)
         self.s = requests.Session()
+        # Keep a connection open for every request the bulk methods can have in flight.
+        # Callers asking for more concurrency than pool_size wait for a free connection
+        # instead of opening (and then throwing away) extra ones.
+        adapter = requests.adapters.HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.connections,
+                                                pool_block=True)
+        self.s.mount('http://', adapter)
+        self.s.mount('https://', adapter)
 
     def update_headers(self, headers):
         self.s.headers.update(headers)
 
     def make_request(self, url=None):
-        return self.s.get(url)
+        if self.cache is None:
+            return self.send(url)
+        return self.cache.fetch(url, self.send)
+
+    def send(self, url, headers=None):
+        # GETs are idempotent, so connection errors, timeouts and RETRY_STATUSES are
+        # retried with jittered exponential backoff before giving up
+        attempt = 0
+        while True:
+            r = None
+            try:
+                r = self._send_once(url, headers)
+            except (requests.ConnectionError, requests.Timeout):
+                self.count('http.error')
+                if attempt >= self.retries:
+                    raise
+            else:
+                if r.status_code not in RETRY_STATUSES or attempt >= self.retries:
+                    return r
 
+            self.count('http.retry')
+            self.sleep(self.retry_delay(attempt, r))
+            attempt += 1
 
-class FFXIvScraper(Scraper):
-    def __init__(self):
-        super(FFXIvScraper, self).__init__()
-        headers = {
-            'Accept-Language': 'en-us,en;q=0.5',
-            'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_8_4) Chrome/27.0.1453.116 Safari/537.36',
-            }
-        self.update_headers(headers)
-        self.lodestone_domain = 'na.finalfantasyxiv.com'
-        self.lodestone_url = 'http://%s/lodestone' % self.lodestone_domain
+    def _send_once(self, url, headers=None):
+        throttle = self.throttle
+        acquired = False
+        started = time.time()
+        try:
+            if throttle is not None:
+                with self.timer('http.throttle_wait'):
+                    waiter = throttle.acquire(self.event)
+                    if waiter is not None:
+                        try:
+                            waiter.wait()
+                        except BaseException:
+                            throttle.abandon(waiter)
+                            raise
+                    # From here on the slot is ours and has to be given back however this ends
+                    acquired = True
+                    delay = throttle.delay()
+                    if delay:
+                        self.sleep(delay)
+                started = time.time()
+
+            r = self.s.get(url, headers=headers, timeout=self.timeout)
+        except (requests.ConnectionError, requests.Timeout):
+            # Lodestone didn't answer, which counts the same as a 503
+            if acquired:
+                throttle.release(None, time.time() - started)
+            raise
+        except BaseException:
+            # A bad URL, GreenletExit from Pool.kill() and the like aren't a throttle signal
+            if acquired:
+                throttle.cancel()
+            raise
+
+        elapsed = time.time() - started
+        if throttle is not None:
+            throttle.release(r.status_code, elapsed)
+
+        if self.metrics is not None:
+            self.record_response(r.status_code, elapsed)
+            # requests can't split DNS/connect out, r.elapsed runs until the headers
+            # are parsed and the rest is reading the body
+            self.metrics.timing('http.ttfb', r.elapsed.total_seconds())
+            self.metrics.timing('http.transfer', max(0, elapsed - r.elapsed.total_seconds()))
+        return r
+
+    def sleep(self, seconds):
+        # gevent is only imported once the sync client is used, so ffxivscraper.aio
+        # doesn't drag it (and its monkey-patching concerns) into asyncio programs
+        import gevent
+        gevent.sleep(seconds)
+
+    def pool(self, size=None):
+        from gevent.pool import Pool
+        return Pool(size or self.pool_size)
+
+    def event(self):
+        from gevent.event import Event
+        return Event()
+
+
+class LodestoneParser(object):
+    # Lodestone URLs and page extraction, shared by FFXIvScraper and
+    # ffxivscraper.aio.AsyncFFXIvScraper so both return identical results
+    lodestone_domain = 'na.finalfantasyxiv.com'
+    lodestone_url = 'http://%s/lodestone' % lodestone_domain
+
+    lodestone_headers = {
+        'Accept-Language': 'en-us,en;q=0.5',
+        'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_8_4) Chrome/27.0.1453.116 Safari/537.36',
+        }
 
-    def scrape_topics(self):
-        url = self.lodestone_url + '/topics/'
-        r = self.make_request(url)
+    def _topics_url(self):
+        return self.lodestone_url + '/topics/'
+
+    def _search_url(self, server_name, character_name):
+        return self.lodestone_url + '/character/?q=%s&worldname=%s' \
+                                    % (url_quote_plus(character_name), server_name)
+
+    def _character_url(self, lodestone_id):
+        return self.lodestone_url + '/character/%s/' % lodestone_id
 
+    def _achievements_url(self, lodestone_id, page):
+        return self.lodestone_url + '/character/%s/achievement/?filter=2&page=%s' % (lodestone_id, page)
+
+    def _free_company_url(self, lodestone_id):
+        return self.lodestone_url + '/freecompany/%s/' % lodestone_id
+
+    def _free_company_members_url(self, lodestone_id, page=1):
+        url = self.lodestone_url + '/freecompany/%s/member' % lodestone_id
+        return url if page == 1 else url + '?page=%s' % page
+
+    def _character_sections(self, include):
+        # include as a set, so a bare 'classes' string fails here instead of being
+        # matched as a substring
+        include = frozenset(include)
+        unknown = include.difference(CHARACTER_SECTIONS)
+        if unknown:
+            raise ValueError('Unknown sections %s, expected some of %s'
+                             % (', '.join(sorted(unknown)), ', '.join(CHARACTER_SECTIONS)))
+        return include
+
+    def _character_key(self, lodestone_id, include):
+        sections = ','.join(sorted(section for section in include if section != 'achievements'))
+        return 'character:%s:%s' % (lodestone_id, sections)
+
+    def _parse_topics(self, soup, since_id=None, since_timestamp=None):
+        # Topics are listed newest first, so with since_id/since_timestamp extraction
+        # stops at the first one already seen (or dated at/before since_timestamp)
+        if since_id is not None:
+            since_id = str(since_id)
+        if since_timestamp is not None:
+            since_timestamp = int(since_timestamp)
         news = []
-        soup = bs4.BeautifulSoup(r.content, "html.parser")
         for tag in soup.select('.topics_list li'):
             entry = {}
             title_tag = tag.select('.topics_list_inner a')[0]
@@ -80,95 +373,113 @@ class FFXIvScraper(Scraper):
             entry['timestamp'] = int(re.findall(r"1[0-9]{9},", script)[0].rstrip(','))
             entry['link'] = '//' + self.lodestone_domain + title_tag['href']
             entry['id'] = entry['link'].split('/')[-1]
-            entry['title'] = title_tag.string.encode('utf-8').strip()
+            if entry['id'] == since_id or (since_timestamp is not None and entry['timestamp'] <= since_timestamp):
+                break
+            entry['title'] = to_str(title_tag.string).strip()
             body = tag.select('.area_inner_cont')[0]
             for a in body.findAll('a'):
                 if a['href'].startswith('/'):
                     a['href'] = '//' + self.lodestone_domain + a['href']
-            entry['body'] = body.encode('utf-8').strip()
+            entry['body'] = to_str(body).strip()
             entry['lang'] = 'en'
             news.append(entry)
         return news
 
-    def validate_character(self, server_name, character_name):
-
-        # Search for character
-        url = self.lodestone_url + '/character/?q=%s&worldname=%s' \
-                                   % (url_quote_plus(character_name), server_name)
-
-        r = self.make_request(url=url)
-
-        if not r:
-            return None
-
-        soup = bs4.BeautifulSoup(r.content, "html.parser")
-
-        for tag in soup.select('.player_name_area .player_name_gold a'):
-            if tag.string.lower() == character_name.lower():
-                return {
-                    'lodestone_id': re.findall(r'(\d+)', tag['href'])[0],
-                    'name': str(tag.string),
-                    }
-
-        return None
-
-    def verify_character(self, server_name, character_name, verification_code, lodestone_id=None):
-        if not lodestone_id:
-            char = self.validate_character(server_name, character_name)
-            if not char:
-                raise DoesNotExist()
-            lodestone_id = char['lodestone_id']
-
-        url = self.lodestone_url + '/character/%s/' % lodestone_id
-
-        r = self.make_request(url=url)
-
-        if not r:
+    # (ETag, Last-Modified, body digest) of the last topics page poll_topics saw
+    _topics_poll = None
+
+    def _topics_poll_headers(self):
+        headers = {}
+        if self._topics_poll is not None:
+            etag, last_modified, digest = self._topics_poll
+            if etag:
+                headers['If-None-Match'] = etag
+            if last_modified:
+                headers['If-Modified-Since'] = last_modified
+        return headers
+
+    def _topics_changed(self, r):
+        # False when Lodestone answered 304 or sent the same page the last poll parsed,
+        # errors are raised rather than passed off as "no news"
+        if r.status_code == 304:
             return False
-
-        soup = bs4.BeautifulSoup(r.content, "html.parser")
-
+        if not r:
+            raise requests.HTTPError('%s response for %s' % (r.status_code, r.url), response=r)
+        return self._topics_poll is None or self._topics_poll[2] != hashlib.sha1(r.content).hexdigest()
+
+    def _topics_parsed(self, r):
+        # Only called once the page parsed, so a failed parse is retried on the next poll
+        self._topics_poll = (r.headers.get('ETag'), r.headers.get('Last-Modified'),
+                             hashlib.sha1(r.content).hexdigest())
+
+    def _parse_search_results(self, soup):
+        return [{
+            'lodestone_id': re.findall(r'(\d+)', tag['href'])[0],
+            'name': str(tag.string),
+            } for tag in soup.select('.player_name_area .player_name_gold a')]
+
+    def _cached_search(self, server_name, character_name):
+        # (found, result) from name_cache
+        if self.name_cache is None:
+            return False, None
+        found, result = self.name_cache.get(server_name, character_name)
+        self.count('name_cache.hit' if found else 'name_cache.miss')
+        return found, result
+
+    def _search(self, soup, server_name, character_name):
+        # Picks character_name out of a search page, remembering every other hit as well
+        with self.timer('parse.search'):
+            results = self._parse_search_results(soup)
+
+        match = None
+        for result in results:
+            if result['name'].lower() == character_name.lower():
+                match = result
+                break
+
+        if self.name_cache is not None:
+            for result in results:
+                self.name_cache.set(server_name, result['name'], result)
+            if match is None:
+                self.name_cache.set(server_name, character_name, None)
+
+        return match and dict(match)
+
+    def _parse_verification(self, soup, server_name, character_name, verification_code, lodestone_id):
         page_name = soup.select('.player_name_txt h2 a')[0].text
         page_server = soup.select('.player_name_txt h2 span')[0].text
         page_name = page_name.strip()
         page_server = page_server.strip()[1:-1]
 
         if page_name != character_name or page_server != server_name:
-            print "%s %s" % (page_name, page_server)
-            print "Name mismatch"
+            log.info('Name mismatch for %s: page has %s (%s)', lodestone_id, page_name, page_server)
             return False
 
         return lodestone_id if soup.select('.txt_selfintroduction')[0].text.strip() == verification_code else False
 
-    def scrape_character(self, lodestone_id):
-        character_url = self.lodestone_url + '/character/%s/' % lodestone_id
-
-        r = self.make_request(url=character_url)
-
-        if not r:
-            raise DoesNotExist()
+    def _parse_character(self, soup, lodestone_id, include=CHARACTER_SECTIONS):
+        with self.timer('parse.character.index'):
+            page = index_tree(soup, CHARACTER_SELECTORS, CHARACTER_LABELS, CHARACTER_TOOLTIPS)
 
-        soup = bs4.BeautifulSoup(r.content, "html.parser")
-        
         character_link = '/lodestone/character/%s/' % lodestone_id
-        if character_link not in soup.select('a.frame__chara__link')[0]['href']:
+        if character_link not in page['a.frame__chara__link'][0]['href']:
             raise DoesNotExist()
         debug_print('character link', character_link)
 
         # Name, Server, Title
-        name = soup.select('p.frame__chara__name')[0].text.strip()
+        name = page['p.frame__chara__name'][0].text.strip()
         debug_print('name', name)
-        server = soup.select('p.frame__chara__world')[0].text.strip()
+        server = page['p.frame__chara__world'][0].text.strip()
         debug_print('server', server)
 
         try:
-            title = soup.select('p.frame__chara__title')[0].text.strip()
+            title = page['p.frame__chara__title'][0].text.strip()
         except (AttributeError, IndexError):
             title = None
         debug_print('title', title)
 
         # Race, Tribe, Gender
-        demographics = soup.find(text='Race/Clan/Gender').parent.parent
+        demographics = page['Race/Clan/Gender'][0].parent.parent
         demographics.select('p.character-block__name')[0].select('br')[0].replace_with(' / ')
         race, clan, gender = demographics.select('p.character-block__name')[0].text.split(' / ')
         debug_print('race', race)
@@ -177,19 +488,19 @@ class FFXIvScraper(Scraper):
         debug_print('gender', gender)
 
         # Nameday & Guardian
-        nameday_guardian_block = soup.find(text='Nameday').parent.parent
+        nameday_guardian_block = page['Nameday'][0].parent.parent
         nameday = nameday_guardian_block.select('p.character-block__birth')[0].text
         debug_print('nameday', nameday)
         guardian = nameday_guardian_block.select('p.character-block__name')[0].text
         debug_print('guardian', guardian)
 
         # City-state
-        citystate = soup.find(text='City-state').parent.parent.select('p.character-block__name')[0].text
+        citystate = page['City-state'][0].parent.parent.select('p.character-block__name')[0].text
         debug_print('citystate', citystate)
 
         # Grand Company
         try:
-            grand_company = soup.find_all(text='Grand Company')[1].parent.parent.select('p.character-block__name')[0].text.split('/')
+            grand_company = page['Grand Company'][1].parent.parent.select('p.character-block__name')[0].text.split('/')
             debug_print('grand company affiliation', grand_company[0])
             debug_print('grand company rank', grand_company[1])
         except (AttributeError, IndexError):
@@ -200,8 +511,8 @@ class FFXIvScraper(Scraper):
         # Free Company
         try:
             free_company = None
-            free_company_name_block = soup.select('div.character__freecompany__name')[0].find('h4').find('a')
-            free_company_crest_block = soup.select('div.character__freecompany__crest__image')[0]
+            free_company_name_block = page['div.character__freecompany__name'][0].find('h4').find('a')
+            free_company_crest_block = page['div.character__freecompany__crest__image'][0]
             free_company = {
                 'id': re.findall('(\d+)', free_company_name_block['href'])[0],
                 'name': free_company_name_block.text,
@@ -216,9 +527,55 @@ class FFXIvScraper(Scraper):
             debug_print('missing fc name', free_company)
             debug_print('missing fc crest', free_company)
 
-        # Classes
+        data = {
+            'name': name,
+            'server': server,
+            'title': title,
+
+            'race': race,
+            'clan': clan,
+            'gender': gender,
+
+            'legacy': len(page['.bt_legacy_history']) > 0,
+
+            'avatar_url': page['div.character__detail__image'][0].select('img')[0]['src'],
+            'portrait_url': page['div.frame__chara__face'][0].select('img')[0]['src'],
+
+            'nameday': nameday,
+            'guardian': guardian,
+
+            'citystate': citystate,
+
+            'grand_company': grand_company,
+            'free_company': free_company,
+        }
+
+        # Optional sections below are left out of the result when not in include
+        if 'classes' in include:
+            with self.timer('parse.character.classes'):
+                data['classes'] = self._parse_classes(page)
+
+        if 'stats' in include:
+            with self.timer('parse.character.stats'):
+                data['stats'] = self._parse_stats(page)
+
+        if 'minions' in include:
+            with self.timer('parse.character.minions'):
+                data['minions'] = self._parse_item_icons(page['div.character__minion'][0])
+
+        if 'mounts' in include:
+            with self.timer('parse.character.mounts'):
+                data['mounts'] = self._parse_item_icons(page['div.character__mounts'][0])
+
+        if 'current_equipment' in include:
+            with self.timer('parse.character.equipment'):
+                data['current_equipment'] = self._parse_equipment(page)
+
+        return data
+
+    def _parse_classes(self, page):
         classes = {}
-        for class_type in soup.select('ul.character__job'):
+        for class_type in page['ul.character__job']:
             for job in class_type.find_all('li'):
                 job_name = job.select('div.character__job__name')[0].text
                 job_level = job.select('div.character__job__level')[0].text
@@ -238,10 +595,12 @@ class FFXIvScraper(Scraper):
 
                 classes[job_name] = dict(level=job_level, exp=job_exp, exp_next=job_exp_next)
 
-        # Stats
+        return classes
+
+    def _parse_stats(self, page):
         stats = {}
 
-        param_blocks = soup.select('table.character__param__list')
+        param_blocks = page['table.character__param__list']
 
         for param_block in param_blocks:
             stat_names = param_block.select('span')
@@ -254,31 +613,25 @@ class FFXIvScraper(Scraper):
 
         for attribute in ('hp', 'mp', 'tp'):
             try:
-                stats[attribute] = int(soup.select('p.character__param__text__' + attribute + '--en-us')[0].next_sibling.text)
+                stats[attribute] = int(page['p.character__param__text__' + attribute + '--en-us'][0].next_sibling.text)
             except IndexError:
                 pass
 
         for element in FFXIV_ELEMENTS:
             tooltip = 'Decreases %s-aspected damage.' % element
-            ele_value = int(soup.find(attrs={"data-tooltip": tooltip}).parent.text)
+            ele_value = int(page[tooltip][0].parent.text)
             stats[element] = ele_value
 
-        mounts = []
-        mount_box = soup.select('div.character__mounts')[0]
-        for mount in mount_box.select('li'):
-            mount_name = mount.select('div.character__item_icon')[0].get("data-tooltip")
-            mounts.append(mount_name)
+        return stats
 
-        minions = []
-        minion_box = soup.select('div.character__minion')[0]
-        for minion in minion_box.select('li'):
-            minion_name = minion.select('div.character__item_icon')[0].get("data-tooltip")
-            minions.append(minion_name)
+    def _parse_item_icons(self, box):
+        # Mount and minion names are only in the icon tooltips
+        return [item.select('div.character__item_icon')[0].get("data-tooltip") for item in box.select('li')]
 
-        # Equipment
+    def _parse_equipment(self, page):
         parsed_equipment = []
 
-        equip_boxes = soup.select('.ic_reflection_box')
+        equip_boxes = page['.ic_reflection_box']
         for equip_box in equip_boxes:
             slot_p = equip_box.select('p.db-tooltip__item__category')
             if len(slot_p) :
@@ -290,7 +643,7 @@ class FFXIvScraper(Scraper):
             else:
                 parsed_equipment.append({})
 
-        for i, tag in enumerate(soup.select('.item_name_right')):
+        for i, tag in enumerate(page['.item_name_right']):
             item_tags = tag.select('.item_name')
 
             if item_tags:
@@ -308,55 +661,11 @@ class FFXIvScraper(Scraper):
             else:
                 parsed_equipment.append(None)
 
-        equipment = parsed_equipment[:len(parsed_equipment)//2]
-
-        data = {
-            'name': name,
-            'server': server,
-            'title': title,
-
-            'race': race,
-            'clan': clan,
-            'gender': gender,
-
-            'legacy': len(soup.select('.bt_legacy_history')) > 0,
-
-            'avatar_url': soup.select('div.character__detail__image')[0].select('img')[0]['src'],
-            'portrait_url': soup.select('div.frame__chara__face')[0].select('img')[0]['src'],
-
-            'nameday': nameday,
-            'guardian': guardian,
-
-            'citystate': citystate,
-
-            'grand_company': grand_company,
-            'free_company': free_company,
-
-            'classes': classes,
-            'stats': stats,
-
-            'achievements': self.scrape_achievements(lodestone_id),
-
-            'minions': minions,
-            'mounts': mounts,
-
-            'current_equipment': equipment,
-        }
-
-        return data
-
-    def scrape_achievements(self, lodestone_id, page=1):
-        url = 'http://na.finalfantasyxiv.com/lodestone/character/%s/achievement/?filter=2&page=%s' \
-              % (lodestone_id, page)
-
-        r = self.make_request(url)
-
-        if not r:
-            return {}
-
-        soup = bs4.BeautifulSoup(r.content, "html.parser")
+        return parsed_equipment[:len(parsed_equipment)//2]
 
-        achievements = {}
+    def _parse_achievements(self, soup):
+        # Ordered as listed, newest first
+        achievements = OrderedDict()
         ach_block = soup.select('div.ldst__achievement')[0]
         for tag in ach_block.select('li.entry'):
             achievement = {
@@ -368,25 +677,28 @@ class FFXIvScraper(Scraper):
             achievements[achievement['id']] = achievement
 
         try:
-            pages = int(math.ceil(float(int(soup.select('.parts__total')[0].text.split(' ')[0]) / 20)))
+            pages = int(math.ceil(int(soup.select('.parts__total')[0].text.split(' ')[0]) / 20.0))
         except (ValueError, IndexError):
             pages = 0
 
-        if pages > page:
-            achievements.update(self.scrape_achievements(lodestone_id, page + 1))
-
-        return achievements
-
-    def scrape_free_company(self, lodestone_id):
-        url = self.lodestone_url + '/freecompany/%s/' % lodestone_id
-        html = self.make_request(url).content
-
-        if 'The page you are searching for has either been removed,' in html:
-            raise DoesNotExist()
-
-        soup = bs4.BeautifulSoup(html, "html.parser")
-
-        fc_tag = strip_tags(soup.select('.vm')[0].contents[-1].encode('utf-8'), ['br']).text
+        return achievements, pages
+
+    def _new_achievements(self, achievements, since_id=None, since_date=None):
+        # Splits one newest-first page at the first known entry, i.e. since_id or anything
+        # dated at or before since_date. Returns (newer entries, whether known data was hit).
+        if since_id is not None:
+            since_id = int(since_id)
+        if since_date is not None:
+            since_date = int(since_date)
+        new = OrderedDict()
+        for achievement_id, achievement in achievements.items():
+            if achievement_id == since_id or (since_date is not None and achievement['date'] <= since_date):
+                return new, True
+            new[achievement_id] = achievement
+        return new, False
+
+    def _parse_free_company(self, soup):
+        fc_tag = strip_tags(to_str(soup.select('.vm')[0].contents[-1]), ['br']).text
         fc_tag = fc_tag[1:-1] if fc_tag else ''
         formed = soup.select('.table_style2 td script')[0].text
 
@@ -400,7 +712,7 @@ class FFXIvScraper(Scraper):
             formed = None
 
         slogan = soup.find(text='Company Slogan').parent.parent.select('td')[0].contents
-        slogan = ''.join(x.encode('utf-8').strip().replace('<br/>', '\n') for x in slogan) if slogan else ""
+        slogan = ''.join(to_str(x).strip().replace('<br/>', '\n') for x in slogan) if slogan else ""
 
         active = soup.find(text='Active').parent.parent.select('td')[0].text.strip()
         recruitment = soup.find(text='Recruitment').parent.parent.select('td')[0].text.strip()
@@ -428,19 +740,25 @@ class FFXIvScraper(Scraper):
             estate['address'] = estate_block.select('p.mb10')[0].text
 
             greeting = estate_block.select('p.mb10')[1].contents
-            estate['greeting'] = ''.join(x.encode('utf-8').strip().replace('<br/>', '\n') for x in greeting) if greeting else ""
+            estate['greeting'] = ''.join(to_str(x).strip().replace('<br/>', '\n') for x in greeting) if greeting else ""
         else:
             estate = None
 
-        url = self.lodestone_url + '/freecompany/%s/member' % lodestone_id
-
-        html = self.make_request(url).content
-
-        if 'The page you are searching for has either been removed,' in html:
-            raise DoesNotExist()
-
-        soup = bs4.BeautifulSoup(html, "html.parser")
+        return {
+            'slogan': slogan,
+            'tag': fc_tag,
+            'formed': formed,
+            'crest': crest,
+            'active': active,
+            'recruitment': recruitment,
+            'active_members': active_members,
+            'rank': rank,
+            'focus': focus,
+            'seeking': seeking,
+            'estate': estate
+        }
 
+    def _parse_free_company_members(self, soup):
         try:
             name = soup.select('.ic_freecompany_box .pt4')[0].text
             server = soup.select('.ic_freecompany_box .crest_id span')[-1].text[1:-1]
@@ -449,61 +767,281 @@ class FFXIvScraper(Scraper):
         except IndexError:
             raise DoesNotExist()
 
+        try:
+            pages = int(soup.find(attrs={'rel': 'last'})['href'].rsplit('=', 1)[-1])
+        except TypeError:
+            pages = 1
+
+        header = {
+            'name': name,
+            'server': server.lower(),
+            'grand_company': grand_company,
+            'friendship': friendship,
+        }
+        return header, self._parse_roster(soup), pages
+
+    def _parse_roster(self, soup):
         roster = []
+        for tag in soup.select('.player_name_area'):
+            if not tag.find('img'):
+                continue
+
+            name_anchor = tag.select('.player_name_gold')[0].find('a')
+
+            member = {
+                'name': name_anchor.text,
+                'lodestone_id': re.findall('(\d+)', name_anchor['href'])[0],
+                'rank': {
+                    'id': int(re.findall('class/(\d+?)\.png', tag.find('img')['src'])[0]),
+                    'name': tag.select('.fc_member_status')[0].text.strip(),
+                    },
+                }
+
+            if member['rank']['id'] == 0:
+                member['leader'] = True
+
+            roster.append(member)
+        return roster
+
+
+class FFXIvScraper(LodestoneParser, Scraper):
+    def __init__(self, **kwargs):
+        super(FFXIvScraper, self).__init__(**kwargs)
+        self.update_headers(self.lodestone_headers)
+
+    @timed('scrape.scrape_topics')
+    def scrape_topics(self):
+        r = self.make_request(self._topics_url())
+        soup = self.make_soup(r.content)
+        with self.timer('parse.topics'):
+            return self._parse_topics(soup)
+
+    @timed('scrape.poll_topics')
+    def poll_topics(self, since_id=None, since_timestamp=None):
+        # Topics newer than since_id/since_timestamp. Meant to be called repeatedly on one
+        # scraper: the request is conditional on the previous poll's page and skips the
+        # response cache, and an unchanged page returns [] without being parsed. Error
+        # responses raise requests.HTTPError.
+        r = self.send(self._topics_url(), self._topics_poll_headers())
+        if not self._topics_changed(r):
+            return []
+        soup = self.make_soup(r.content)
+        with self.timer('parse.topics'):
+            topics = self._parse_topics(soup, since_id, since_timestamp)
+        self._topics_parsed(r)
+        return topics
+
+    @timed('scrape.validate_character')
+    def validate_character(self, server_name, character_name):
+        found, result = self._cached_search(server_name, character_name)
+        if found:
+            return result
+
+        # Search for character. Skips the response cache: name_cache has its own (shorter)
+        # TTL for misses, and a character created a minute ago should be found.
+        r = self.send(self._search_url(server_name, character_name))
+
+        if not r:
+            return None
+
+        return self._search(self.make_soup(r.content), server_name, character_name)
 
-        def populate_roster(page=1, soup=None):
-            if not soup:
-                r = self.make_request(url + '?page=%s' % page)
-                soup = bs4.BeautifulSoup(r.content, "html.parser")
+    def resolve_characters(self, names, concurrency=None):
+        # Bulk validate_character: names is (server_name, character_name) pairs, returns
+        # {pair: result}. Repeats are searched once and failures are returned in place
+        # of the result.
+        names = list(names)
+        unique = {}
+        for server_name, character_name in names:
+            unique.setdefault((server_name.lower(), character_name.lower()), (server_name, character_name))
 
-            for tag in soup.select('.player_name_area'):
-                if not tag.find('img'):
-                    continue
+        def resolve(key):
+            try:
+                return key, self.validate_character(*unique[key])
+            except Exception as e:
+                return key, e
 
-                name_anchor = tag.select('.player_name_gold')[0].find('a')
+        pool = self.pool(concurrency)
+        results = dict(pool.imap_unordered(resolve, list(unique)))
+        return dict(((server_name, character_name), results[(server_name.lower(), character_name.lower())])
+                    for server_name, character_name in names)
 
-                member = {
-                    'name': name_anchor.text,
-                    'lodestone_id': re.findall('(\d+)', name_anchor['href'])[0],
-                    'rank': {
-                        'id': int(re.findall('class/(\d+?)\.png', tag.find('img')['src'])[0]),
-                        'name': tag.select('.fc_member_status')[0].text.strip(),
-                        },
-                    }
+    @timed('scrape.verify_character')
+    def verify_character(self, server_name, character_name, verification_code, lodestone_id=None):
+        if not lodestone_id:
+            char = self.validate_character(server_name, character_name)
+            if not char:
+                raise DoesNotExist()
+            lodestone_id = char['lodestone_id']
 
-                if member['rank']['id'] == 0:
-                    member['leader'] = True
+        # Always a fresh copy, the code has usually only just been added to the profile
+        r = self.send(self._character_url(lodestone_id))
 
-                roster.append(member)
+        if not r:
+            return False
+
+        soup = self.make_soup(r.content, VERIFICATION_STRAINER)
+        with self.timer('parse.verification'):
+            return self._parse_verification(soup, server_name, character_name, verification_code, lodestone_id)
 
-        populate_roster(soup=soup)
+    def verify_characters(self, verifications, concurrency=None):
+        # Bulk verify_character: verifications is (server_name, character_name,
+        # verification_code[, lodestone_id]) tuples. Yields (verification, result) as each
+        # finishes, failures are yielded in place of the result. Without a lodestone_id the
+        # search goes through name_cache when one is set.
+        def verify(verification):
+            try:
+                return verification, self.verify_character(*verification)
+            except Exception as e:
+                return verification, e
 
+        concurrency = concurrency or self.pool_size
+        pool = self.pool(concurrency)
         try:
-            pages = int(soup.find(attrs={'rel': 'last'})['href'].rsplit('=', 1)[-1])
-        except TypeError:
-            pages = 1
+            for result in pool.imap_unordered(verify, verifications, maxsize=concurrency):
+                yield result
+        finally:
+            # Stop the remaining lookups if the caller stops iterating early
+            pool.kill()
 
-        if pages > 1:
-            pool = Pool(5)
-            for page in xrange(2, pages + 1):
-                pool.spawn(populate_roster, page)
-            pool.join()
+    @timed('scrape.scrape_character')
+    def scrape_character(self, lodestone_id, include=CHARACTER_SECTIONS):
+        include = self._character_sections(include)
+        r = self.make_request(url=self._character_url(lodestone_id))
 
-        return {
-            'name': name,
-            'server': server.lower(),
-            'grand_company': grand_company,
-            'friendship': friendship,
-            'roster': roster,
-            'slogan': slogan,
-            'tag': fc_tag,
-            'formed': formed,
-            'crest': crest,
-            'active': active,
-            'recruitment': recruitment,
-            'active_members': active_members,
-            'rank': rank,
-            'focus': focus,
-            'seeking': seeking,
-            'estate': estate
-        }
+        if not r:
+            raise DoesNotExist()
+
+        data = self.parse_page(self._character_key(lodestone_id, include), r.content,
+                               lambda soup: self._parse_character(soup, lodestone_id, include))
+
+        if 'achievements' in include:
+            data['achievements'] = self.scrape_achievements(lodestone_id)
+
+        return data
+
+    def scrape_characters(self, lodestone_ids, concurrency=None, include=CHARACTER_SECTIONS):
+        # Yields (lodestone_id, data) as each character finishes. Failures are yielded
+        # in place of the data so one bad id doesn't abort the batch.
+        include = self._character_sections(include)
+
+        def scrape(lodestone_id):
+            try:
+                return lodestone_id, self.scrape_character(lodestone_id, include=include)
+            except Exception as e:
+                return lodestone_id, e
+
+        # maxsize bounds finished-but-unconsumed results, so ids are pulled lazily
+        concurrency = concurrency or self.pool_size
+        pool = self.pool(concurrency)
+        try:
+            for result in pool.imap_unordered(scrape, lodestone_ids, maxsize=concurrency):
+                yield result
+        finally:
+            # Stop the remaining scrapes if the caller stops iterating early
+            pool.kill()
+
+    @timed('scrape.scrape_achievements')
+    def scrape_achievements(self, lodestone_id, page=1, since_id=None, since_date=None):
+        # With since_id/since_date only achievements earned after them are returned, and
+        # pages are walked one at a time until one reaches them
+        r = self.make_request(self._achievements_url(lodestone_id, page))
+
+        if not r:
+            return {}
+
+        achievements, pages = self.parse_page('achievements:%s:%s' % (lodestone_id, page), r.content,
+                                              self._parse_achievements)
+
+        if since_id is not None or since_date is not None:
+            achievements, known = self._new_achievements(achievements, since_id, since_date)
+            while not known and page < pages:
+                page += 1
+                r = self.make_request(self._achievements_url(lodestone_id, page))
+                if not r:
+                    break
+                new, known = self._new_achievements(
+                    self.parse_page('achievements:%s:%s' % (lodestone_id, page), r.content,
+                                    self._parse_achievements)[0], since_id, since_date)
+                achievements.update(new)
+            return achievements
+
+        if pages > page:
+            def fetch_page(page):
+                r = self.make_request(self._achievements_url(lodestone_id, page))
+                if not r:
+                    return {}
+                return self.parse_page('achievements:%s:%s' % (lodestone_id, page), r.content,
+                                       self._parse_achievements)[0]
+
+            # Pool.map keeps page order, so later pages win just like the serial walk did
+            pool = self.pool(self.page_concurrency)
+            for page_achievements in pool.map(fetch_page, xrange(page + 1, pages + 1)):
+                achievements.update(page_achievements)
+
+        return achievements
+
+    @timed('scrape.scrape_free_company')
+    def scrape_free_company(self, lodestone_id):
+        # The profile and the first roster page are fetched together, and the remaining
+        # roster pages start as soon as the first one says how many there are
+        pool = self.pool(self.page_concurrency)
+        try:
+            profile = pool.spawn(self.make_request, self._free_company_url(lodestone_id))
+
+            html = self.make_request(self._free_company_members_url(lodestone_id)).content
+
+            if FREE_COMPANY_MISSING in html:
+                raise DoesNotExist()
+
+            header, roster, pages = self.parse_page('freecompany-members:%s:1' % lodestone_id, html,
+                                                    self._parse_free_company_members)
+
+            roster_pages = [pool.spawn(self._scrape_roster_page, lodestone_id, page)
+                            for page in xrange(2, pages + 1)]
+
+            html = profile.get().content
+
+            if FREE_COMPANY_MISSING in html:
+                raise DoesNotExist()
+
+            data = self.parse_page('freecompany:%s' % lodestone_id, html, self._parse_free_company)
+
+            for roster_page in roster_pages:
+                roster.extend(roster_page.get())
+        finally:
+            pool.kill()
+
+        data.update(header)
+        data['roster'] = roster
+        return data
+
+    def _scrape_roster_page(self, lodestone_id, page):
+        r = self.make_request(self._free_company_members_url(lodestone_id, page))
+        return self.parse_page('freecompany-members:%s:%s' % (lodestone_id, page), r.content,
+                               self._parse_roster)
+
+    def iter_free_company_members(self, lodestone_id, ordered=False):
+        # Yields roster members as each page is parsed, at most page_concurrency pages
+        # are fetched or waiting to be consumed at once. ordered=True yields them in
+        # Lodestone's page order, otherwise pages come as they finish.
+        html = self.make_request(self._free_company_members_url(lodestone_id)).content
+
+        if FREE_COMPANY_MISSING in html:
+            raise DoesNotExist()
+
+        header, roster, pages = self.parse_page('freecompany-members:%s:1' % lodestone_id, html,
+                                                self._parse_free_company_members)
+        for member in roster:
+            yield member
+
+        if pages > 1:
+            pool = self.pool(self.page_concurrency)
+            imap = pool.imap if ordered else pool.imap_unordered
+            try:
+                for members in imap(lambda page: self._scrape_roster_page(lodestone_id, page),
+                                    xrange(2, pages + 1), maxsize=self.page_concurrency):
+                    for member in members:
+                        yield member
+            finally:
+                pool.kill()
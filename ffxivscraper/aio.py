@@ -0,0 +1,400 @@
+# asyncio client, needs Python 3.6+ and aiohttp (pip install ffxivscraper[async]).
+# Importing it never imports gevent, the extraction code is shared with FFXIvScraper.
+
+import asyncio
+import functools
+import time
+
+import aiohttp
+from requests.structures import CaseInsensitiveDict
+
+from ffxivscraper import (BaseScraper, LodestoneParser, DoesNotExist, CHARACTER_SECTIONS,
+                          FREE_COMPANY_MISSING, RETRY_STATUSES, VERIFICATION_STRAINER)
+
+
+def timed(name):
+    # Coroutine version of ffxivscraper.metrics.timed
+    def decorator(fn):
+        @functools.wraps(fn)
+        async def wrapper(self, *args, **kwargs):
+            if self.metrics is None:
+                return await fn(self, *args, **kwargs)
+            with self.timer(name):
+                try:
+                    return await fn(self, *args, **kwargs)
+                except Exception:
+                    self.metrics.incr(name + '.error')
+                    raise
+        return wrapper
+    return decorator
+
+
+class Response(object):
+    # The parts of a requests.Response the scrapers and cache.ResponseCache rely on,
+    # plain enough to be pickled into a SQLiteCache
+    def __init__(self, url, status_code, headers, content):
+        self.url = url
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+
+    @property
+    def ok(self):
+        return self.status_code < 400
+
+    def __bool__(self):
+        return self.ok
+
+
+class AsyncScraper(BaseScraper):
+    def __init__(self, **kwargs):
+        super(AsyncScraper, self).__init__(**kwargs)
+        self.headers = {}
+        self._session = None
+
+    def update_headers(self, headers):
+        self.headers.update(headers)
+
+    def session(self):
+        # Created on first use so it binds to the running event loop
+        if self._session is None:
+            if isinstance(self.timeout, tuple):
+                connect, read = self.timeout
+            else:
+                connect = read = self.timeout
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.connections),
+                timeout=aiohttp.ClientTimeout(sock_connect=connect, sock_read=read),
+                headers=self.headers,
+                trace_configs=[self._trace_config()] if self.metrics is not None else [])
+        return self._session
+
+    def _trace_config(self):
+        # aiohttp reports DNS and connect phases, which requests can't
+        def phase(name):
+            async def start(session, context, params):
+                setattr(context, name, time.time())
+
+            async def end(session, context, params):
+                self.metrics.timing('http.' + name, time.time() - getattr(context, name))
+            return start, end
+
+        trace_config = aiohttp.TraceConfig()
+        dns_start, dns_end = phase('dns')
+        trace_config.on_dns_resolvehost_start.append(dns_start)
+        trace_config.on_dns_resolvehost_end.append(dns_end)
+        connect_start, connect_end = phase('connect')
+        trace_config.on_connection_create_start.append(connect_start)
+        trace_config.on_connection_create_end.append(connect_end)
+        return trace_config
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def make_request(self, url=None):
+        if self.cache is None:
+            return await self.send(url)
+
+        entry, r = self.cache.cached(url)
+        if r is not None:
+            return r
+        return self.cache.update(url, entry, await self.send(url, self.cache.conditional_headers(entry)))
+
+    async def send(self, url, headers=None):
+        # Same retry policy as Scraper.send
+        attempt = 0
+        while True:
+            r = None
+            try:
+                r = await self._send_once(url, headers)
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                self.count('http.error')
+                if attempt >= self.retries:
+                    raise
+            else:
+                if r.status_code not in RETRY_STATUSES or attempt >= self.retries:
+                    return r
+
+            self.count('http.retry')
+            await asyncio.sleep(self.retry_delay(attempt, r))
+            attempt += 1
+
+    async def _send_once(self, url, headers=None):
+        throttle = self.throttle
+        acquired = False
+        started = time.time()
+        try:
+            if throttle is not None:
+                with self.timer('http.throttle_wait'):
+                    waiter = throttle.acquire(asyncio.Event)
+                    if waiter is not None:
+                        try:
+                            await waiter.wait()
+                        except BaseException:
+                            throttle.abandon(waiter)
+                            raise
+                    # Same slot handling as Scraper._send_once
+                    acquired = True
+                    delay = throttle.delay()
+                    if delay:
+                        await asyncio.sleep(delay)
+                started = time.time()
+
+            async with self.session().get(url, headers=headers) as resp:
+                ttfb = time.time() - started
+                r = Response(str(resp.url), resp.status, CaseInsensitiveDict(resp.headers), await resp.read())
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            if acquired:
+                throttle.release(None, time.time() - started)
+            raise
+        except BaseException:
+            # Includes CancelledError, an Exception before Python 3.8
+            if acquired:
+                throttle.cancel()
+            raise
+
+        elapsed = time.time() - started
+        if throttle is not None:
+            throttle.release(r.status_code, elapsed)
+
+        if self.metrics is not None:
+            self.record_response(r.status_code, elapsed)
+            self.metrics.timing('http.ttfb', ttfb)
+            self.metrics.timing('http.transfer', elapsed - ttfb)
+        return r
+
+
+class AsyncFFXIvScraper(LodestoneParser, AsyncScraper):
+    def __init__(self, **kwargs):
+        super(AsyncFFXIvScraper, self).__init__(**kwargs)
+        self.update_headers(self.lodestone_headers)
+
+    @timed('scrape.scrape_topics')
+    async def scrape_topics(self):
+        r = await self.make_request(self._topics_url())
+        soup = self.make_soup(r.content)
+        with self.timer('parse.topics'):
+            return self._parse_topics(soup)
+
+    @timed('scrape.poll_topics')
+    async def poll_topics(self, since_id=None, since_timestamp=None):
+        r = await self.send(self._topics_url(), self._topics_poll_headers())
+        if not self._topics_changed(r):
+            return []
+        soup = self.make_soup(r.content)
+        with self.timer('parse.topics'):
+            topics = self._parse_topics(soup, since_id, since_timestamp)
+        self._topics_parsed(r)
+        return topics
+
+    @timed('scrape.validate_character')
+    async def validate_character(self, server_name, character_name):
+        found, result = self._cached_search(server_name, character_name)
+        if found:
+            return result
+
+        # Skips the response cache, see FFXIvScraper.validate_character
+        r = await self.send(self._search_url(server_name, character_name))
+
+        if not r:
+            return None
+
+        return self._search(self.make_soup(r.content), server_name, character_name)
+
+    async def resolve_characters(self, names, concurrency=None):
+        # Same as FFXIvScraper.resolve_characters
+        names = list(names)
+        unique = {}
+        for server_name, character_name in names:
+            unique.setdefault((server_name.lower(), character_name.lower()), (server_name, character_name))
+
+        semaphore = asyncio.Semaphore(concurrency or self.pool_size)
+
+        async def resolve(key):
+            async with semaphore:
+                try:
+                    return key, await self.validate_character(*unique[key])
+                except Exception as e:
+                    return key, e
+
+        results = dict(await asyncio.gather(*[resolve(key) for key in unique]))
+        return dict(((server_name, character_name), results[(server_name.lower(), character_name.lower())])
+                    for server_name, character_name in names)
+
+    @timed('scrape.verify_character')
+    async def verify_character(self, server_name, character_name, verification_code, lodestone_id=None):
+        if not lodestone_id:
+            char = await self.validate_character(server_name, character_name)
+            if not char:
+                raise DoesNotExist()
+            lodestone_id = char['lodestone_id']
+
+        # Skips the response cache, see FFXIvScraper.verify_character
+        r = await self.send(self._character_url(lodestone_id))
+
+        if not r:
+            return False
+
+        soup = self.make_soup(r.content, VERIFICATION_STRAINER)
+        with self.timer('parse.verification'):
+            return self._parse_verification(soup, server_name, character_name, verification_code, lodestone_id)
+
+    async def verify_characters(self, verifications, concurrency=None):
+        # Like FFXIvScraper.verify_characters, but returns the (verification, result)
+        # pairs as a list in input order
+        semaphore = asyncio.Semaphore(concurrency or self.pool_size)
+
+        async def verify(verification):
+            async with semaphore:
+                try:
+                    return verification, await self.verify_character(*verification)
+                except Exception as e:
+                    return verification, e
+
+        return list(await asyncio.gather(*[verify(verification) for verification in verifications]))
+
+    @timed('scrape.scrape_character')
+    async def scrape_character(self, lodestone_id, include=CHARACTER_SECTIONS):
+        include = self._character_sections(include)
+        r = await self.make_request(self._character_url(lodestone_id))
+
+        if not r:
+            raise DoesNotExist()
+
+        data = self.parse_page(self._character_key(lodestone_id, include), r.content,
+                               lambda soup: self._parse_character(soup, lodestone_id, include))
+
+        if 'achievements' in include:
+            data['achievements'] = await self.scrape_achievements(lodestone_id)
+
+        return data
+
+    @timed('scrape.scrape_achievements')
+    async def scrape_achievements(self, lodestone_id, page=1, since_id=None, since_date=None):
+        r = await self.make_request(self._achievements_url(lodestone_id, page))
+
+        if not r:
+            return {}
+
+        achievements, pages = self.parse_page('achievements:%s:%s' % (lodestone_id, page), r.content,
+                                              self._parse_achievements)
+
+        if since_id is not None or since_date is not None:
+            achievements, known = self._new_achievements(achievements, since_id, since_date)
+            while not known and page < pages:
+                page += 1
+                r = await self.make_request(self._achievements_url(lodestone_id, page))
+                if not r:
+                    break
+                new, known = self._new_achievements(
+                    self.parse_page('achievements:%s:%s' % (lodestone_id, page), r.content,
+                                    self._parse_achievements)[0], since_id, since_date)
+                achievements.update(new)
+            return achievements
+
+        semaphore = asyncio.Semaphore(self.page_concurrency)
+
+        async def fetch_page(page):
+            async with semaphore:
+                r = await self.make_request(self._achievements_url(lodestone_id, page))
+            if not r:
+                return {}
+            return self.parse_page('achievements:%s:%s' % (lodestone_id, page), r.content,
+                                   self._parse_achievements)[0]
+
+        # gather keeps page order, so the merge matches FFXIvScraper.scrape_achievements
+        for page_achievements in await asyncio.gather(*[fetch_page(p) for p in range(page + 1, pages + 1)]):
+            achievements.update(page_achievements)
+
+        return achievements
+
+    @timed('scrape.scrape_free_company')
+    async def scrape_free_company(self, lodestone_id):
+        # Same overlap as FFXIvScraper.scrape_free_company
+        profile = asyncio.ensure_future(self.make_request(self._free_company_url(lodestone_id)))
+        roster_pages = None
+        try:
+            r = await self.make_request(self._free_company_members_url(lodestone_id))
+
+            if FREE_COMPANY_MISSING in r.content:
+                raise DoesNotExist()
+
+            header, roster, pages = self.parse_page('freecompany-members:%s:1' % lodestone_id, r.content,
+                                                    self._parse_free_company_members)
+
+            semaphore = asyncio.Semaphore(self.page_concurrency)
+
+            async def fetch_roster(page):
+                async with semaphore:
+                    return await self._scrape_roster_page(lodestone_id, page)
+
+            roster_pages = asyncio.gather(*[fetch_roster(p) for p in range(2, pages + 1)])
+
+            r = await profile
+
+            if FREE_COMPANY_MISSING in r.content:
+                raise DoesNotExist()
+
+            data = self.parse_page('freecompany:%s' % lodestone_id, r.content, self._parse_free_company)
+
+            for members in await roster_pages:
+                roster.extend(members)
+        finally:
+            profile.cancel()
+            if roster_pages is not None:
+                roster_pages.cancel()
+
+        data.update(header)
+        data['roster'] = roster
+        return data
+
+    async def _scrape_roster_page(self, lodestone_id, page):
+        r = await self.make_request(self._free_company_members_url(lodestone_id, page))
+        return self.parse_page('freecompany-members:%s:%s' % (lodestone_id, page), r.content,
+                               self._parse_roster)
+
+    async def iter_free_company_members(self, lodestone_id, ordered=False):
+        # Async generator version of FFXIvScraper.iter_free_company_members
+        r = await self.make_request(self._free_company_members_url(lodestone_id))
+
+        if FREE_COMPANY_MISSING in r.content:
+            raise DoesNotExist()
+
+        header, roster, pages = self.parse_page('freecompany-members:%s:1' % lodestone_id, r.content,
+                                                self._parse_free_company_members)
+        for member in roster:
+            yield member
+
+        remaining = iter(range(2, pages + 1))
+        in_flight = []
+        try:
+            while True:
+                for page in remaining:
+                    in_flight.append(asyncio.ensure_future(self._scrape_roster_page(lodestone_id, page)))
+                    if len(in_flight) >= self.page_concurrency:
+                        break
+                if not in_flight:
+                    break
+
+                if ordered:
+                    done = in_flight.pop(0)
+                    members = await done
+                else:
+                    finished, _ = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+                    done = finished.pop()
+                    in_flight.remove(done)
+                    members = done.result()
+
+                for member in members:
+                    yield member
+        finally:
+            for task in in_flight:
+                task.cancel()
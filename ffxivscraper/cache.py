@@ -0,0 +1,241 @@
+from collections import OrderedDict
+import re
+import sqlite3
+import time
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+
+class MemoryCache(object):
+    # Bounded in-process LRU, values are stored as-is. maxsize counts entries, or with
+    # weigh(value) given the sum of their weights (e.g. bytes)
+    def __init__(self, maxsize=1024, weigh=None):
+        self.maxsize = maxsize
+        self.weigh = weigh
+        self.weight = 0
+        self._data = OrderedDict()
+
+    def _weight_of(self, value):
+        return self.weigh(value) if self.weigh is not None else 1
+
+    def get(self, key, default=None):
+        try:
+            value = self._data.pop(key)
+        except KeyError:
+            return default
+        self._data[key] = value
+        return value
+
+    def set(self, key, value):
+        self.delete(key)
+        self._data[key] = value
+        self.weight += self._weight_of(value)
+        while self.weight > self.maxsize and self._data:
+            self.weight -= self._weight_of(self._data.popitem(last=False)[1])
+
+    def delete(self, key):
+        if key in self._data:
+            self.weight -= self._weight_of(self._data.pop(key))
+
+    def __len__(self):
+        return len(self._data)
+
+
+class SQLiteCache(object):
+    # File backed LRU that survives restarts, values are pickled. Eviction runs every
+    # few hundred writes, so the table can briefly grow a little past maxsize.
+    evict_every = 256
+
+    def __init__(self, path, maxsize=100000):
+        self.maxsize = maxsize
+        self._writes = 0
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute('CREATE TABLE IF NOT EXISTS cache '
+                        '(key TEXT PRIMARY KEY, value BLOB, accessed REAL)')
+        self.db.execute('CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)')
+        self.db.commit()
+
+    def get(self, key, default=None):
+        row = self.db.execute('SELECT value FROM cache WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return default
+        self.db.execute('UPDATE cache SET accessed = ? WHERE key = ?', (time.time(), key))
+        self.db.commit()
+        return pickle.loads(bytes(row[0]))
+
+    def set(self, key, value):
+        blob = sqlite3.Binary(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+        self.db.execute('INSERT OR REPLACE INTO cache (key, value, accessed) VALUES (?, ?, ?)',
+                        (key, blob, time.time()))
+        self._writes += 1
+        if self._writes % self.evict_every == 0:
+            self.db.execute('DELETE FROM cache WHERE key IN '
+                            '(SELECT key FROM cache ORDER BY accessed DESC LIMIT -1 OFFSET ?)',
+                            (self.maxsize,))
+        self.db.commit()
+
+    def delete(self, key):
+        self.db.execute('DELETE FROM cache WHERE key = ?', (key,))
+        self.db.commit()
+
+    def __len__(self):
+        return self.db.execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+
+
+# Lodestone pages by how often they change, first match wins
+URL_CLASSES = [
+    ('topics', re.compile(r'/lodestone/topics/')),
+    ('achievement', re.compile(r'/lodestone/character/\d+/achievement/')),
+    ('search', re.compile(r'/lodestone/character/\?')),
+    ('character', re.compile(r'/lodestone/character/\d+/')),
+    ('freecompany', re.compile(r'/lodestone/freecompany/\d+/')),
+]
+
+# Seconds a cached page is served without asking Lodestone, None is anything unclassified
+DEFAULT_TTLS = {
+    'topics': 300,
+    'achievement': 6 * 3600,
+    'search': 24 * 3600,
+    'character': 3600,
+    'freecompany': 3600,
+    None: 600,
+}
+
+
+def url_class(url):
+    for name, pattern in URL_CLASSES:
+        if pattern.search(url):
+            return name
+    return None
+
+
+class CacheEntry(object):
+    def __init__(self, response, expires):
+        self.response = response
+        self.expires = expires
+        self.etag = response.headers.get('ETag')
+        self.last_modified = response.headers.get('Last-Modified')
+
+
+def entry_size(entry):
+    return len(entry.response.content)
+
+
+# Page bytes ResponseCache keeps in memory by default, character pages run 150-300 KB
+MEMORY_BYTES = 32 * 1024 * 1024
+
+
+class ResponseCache(object):
+    # HTTP cache for Scraper.make_request. Fresh entries are served locally, stale ones
+    # are revalidated with a conditional GET when Lodestone sent an ETag/Last-Modified.
+    # memory is checked first and disk (e.g. a SQLiteCache) backs it across restarts.
+    def __init__(self, memory=None, disk=None, ttls=None):
+        self.memory = MemoryCache(MEMORY_BYTES, entry_size) if memory is None else memory
+        self.disk = disk
+        self.ttls = dict(DEFAULT_TTLS)
+        self.ttls.update(ttls or {})
+
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+
+    def stats(self):
+        return {'hits': self.hits, 'revalidated': self.revalidated, 'misses': self.misses}
+
+    def ttl(self, url):
+        return self.ttls.get(url_class(url), self.ttls[None])
+
+    def lookup(self, url):
+        entry = self.memory.get(url)
+        if entry is None and self.disk is not None:
+            entry = self.disk.get(url)
+            if entry is not None:
+                self.memory.set(url, entry)
+        return entry
+
+    def store(self, url, response):
+        if not response:
+            return
+        entry = CacheEntry(response, time.time() + self.ttl(url))
+        self.memory.set(url, entry)
+        if self.disk is not None:
+            self.disk.set(url, entry)
+
+    def refresh(self, url, entry, response):
+        # Lodestone answered 304, keep the body we have and start a new TTL
+        entry.expires = time.time() + self.ttl(url)
+        entry.etag = response.headers.get('ETag', entry.etag)
+        entry.last_modified = response.headers.get('Last-Modified', entry.last_modified)
+        self.memory.set(url, entry)
+        if self.disk is not None:
+            self.disk.set(url, entry)
+
+    def conditional_headers(self, entry):
+        headers = {}
+        if entry is not None:
+            if entry.etag:
+                headers['If-None-Match'] = entry.etag
+            if entry.last_modified:
+                headers['If-Modified-Since'] = entry.last_modified
+        return headers
+
+    def fetch(self, url, get):
+        # get(url, headers) does the actual request
+        entry, r = self.cached(url)
+        if r is not None:
+            return r
+        return self.update(url, entry, get(url, self.conditional_headers(entry)))
+
+    def cached(self, url):
+        # Returns (entry, response), response is only set when entry is fresh enough to
+        # use without asking Lodestone
+        entry = self.lookup(url)
+        if entry is not None and entry.expires > time.time():
+            self.hits += 1
+            return entry, entry.response
+        return entry, None
+
+    def update(self, url, entry, r):
+        # Records the answer to a (conditional) request for url and returns the response
+        # the caller should use
+        if r.status_code == 304 and entry is not None:
+            self.revalidated += 1
+            self.refresh(url, entry, r)
+            return entry.response
+
+        self.misses += 1
+        self.store(url, r)
+        return r
+
+
+class NameCache(object):
+    # (server, character name) -> validate_character result for the scrapers' name_cache.
+    # Every hit on a search page is stored, not just the name searched for, and names
+    # Lodestone didn't find are remembered for negative_ttl. Expired entries are dropped
+    # when read; store (a MemoryCache by default, or a SQLiteCache) bounds the size.
+    def __init__(self, store=None, ttl=24 * 3600, negative_ttl=600):
+        self.store = MemoryCache(maxsize=100000) if store is None else store
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+
+    def key(self, server_name, character_name):
+        return '%s:%s' % (server_name.lower(), character_name.lower())
+
+    def get(self, server_name, character_name):
+        # Returns (found, result), result is None for a remembered miss
+        key = self.key(server_name, character_name)
+        entry = self.store.get(key)
+        if entry is None:
+            return False, None
+        expires, result = entry
+        if expires <= time.time():
+            self.store.delete(key)
+            return False, None
+        return True, result and dict(result)
+
+    def set(self, server_name, character_name, result):
+        ttl = self.ttl if result is not None else self.negative_ttl
+        self.store.set(self.key(server_name, character_name), (time.time() + ttl, result))
@@ -0,0 +1,85 @@
+from collections import defaultdict
+import functools
+import time
+
+
+class Metrics(object):
+    # Sink for scraper instrumentation, pass one as metrics= to a scraper. Subclass it
+    # to forward to statsd, Prometheus etc. Names are dotted, e.g. 'http.request',
+    # 'parse.character.classes', 'scrape.scrape_character'; timings are in seconds.
+    def timing(self, name, seconds):
+        pass
+
+    def incr(self, name, value=1):
+        pass
+
+
+class MemoryMetrics(Metrics):
+    # Keeps every counter and timing in process, for debugging and benchmarks
+    def __init__(self):
+        self.counters = defaultdict(int)
+        self.timings = defaultdict(list)
+
+    def timing(self, name, seconds):
+        self.timings[name].append(seconds)
+
+    def incr(self, name, value=1):
+        self.counters[name] += value
+
+    def summary(self):
+        summary = {}
+        for name, values in self.timings.items():
+            values = sorted(values)
+            summary[name] = {
+                'count': len(values),
+                'total': sum(values),
+                'mean': sum(values) / len(values),
+                'p50': values[len(values) // 2],
+                'p95': values[min(len(values) - 1, int(len(values) * 0.95))],
+                'max': values[-1],
+            }
+        return summary
+
+
+class Timer(object):
+    __slots__ = ('metrics', 'name', 'started')
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.time()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.metrics.timing(self.name, time.time() - self.started)
+
+
+class NullTimer(object):
+    # What scrapers hand out while metrics is None, so instrumentation costs one call
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+NULL_TIMER = NullTimer()
+
+
+def timed(name):
+    # Times a scraper method as name, skipped entirely without a metrics sink
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(self, *args, **kwargs):
+            if self.metrics is None:
+                return fn(self, *args, **kwargs)
+            with self.timer(name):
+                try:
+                    return fn(self, *args, **kwargs)
+                except Exception:
+                    self.metrics.incr(name + '.error')
+                    raise
+        return wrapper
+    return decorator
@@ -0,0 +1,158 @@
+# Compact alternatives to the dicts scrape_character and scrape_free_company return,
+# for holding many characters in memory at once. Every class has from_dict() taking
+# the scraper's dict and to_dict() giving an equal dict back.
+#
+#   character = Character.from_dict(s.scrape_character(1234567))
+#   roster = [Member.from_dict(m) for m in s.iter_free_company_members(9229283011365743624)]
+
+from ffxivscraper import CHARACTER_SECTIONS
+
+# Job, stat, slot, item, achievement names etc. repeat across every character, so each
+# distinct string is kept once. sys.intern won't take unicode on Python 2, hence the dict.
+_names = {}
+
+
+def intern_name(name):
+    if name is None:
+        return None
+    return _names.setdefault(name, name)
+
+
+class Model(object):
+    __slots__ = ()
+
+    def to_dict(self):
+        return dict((name, getattr(self, name)) for name in self.__slots__)
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self.to_dict() == other.to_dict()
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return '<%s %r>' % (type(self).__name__, getattr(self, 'name', None))
+
+
+class ClassJob(Model):
+    __slots__ = ('level', 'exp', 'exp_next')
+
+    def __init__(self, level, exp, exp_next):
+        self.level = level
+        self.exp = exp
+        self.exp_next = exp_next
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['level'], data['exp'], data['exp_next'])
+
+
+class Equipment(Model):
+    __slots__ = ('slot', 'name', 'img')
+
+    def __init__(self, slot, name, img):
+        self.slot = intern_name(slot)
+        self.name = intern_name(name)
+        self.img = intern_name(img)
+
+    @classmethod
+    def from_dict(cls, data):
+        # Empty slots are {} in scrape_character results and None here
+        if not data:
+            return None
+        return cls(data['slot'], data['name'], data['img'])
+
+
+class Achievement(Model):
+    __slots__ = ('id', 'icon', 'name', 'date')
+
+    def __init__(self, id, icon, name, date):
+        self.id = id
+        self.icon = intern_name(icon)
+        self.name = intern_name(name)
+        self.date = date
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['id'], data['icon'], data['name'], data['date'])
+
+
+class Character(Model):
+    __slots__ = ('name', 'server', 'title', 'race', 'clan', 'gender', 'legacy', 'avatar_url',
+                 'portrait_url', 'nameday', 'guardian', 'citystate', 'grand_company',
+                 'free_company') + CHARACTER_SECTIONS
+
+    @classmethod
+    def from_dict(cls, data):
+        self = cls()
+        for name in ('name', 'avatar_url', 'portrait_url', 'legacy', 'free_company'):
+            setattr(self, name, data[name])
+        for name in ('server', 'title', 'race', 'clan', 'gender', 'nameday', 'guardian', 'citystate'):
+            setattr(self, name, intern_name(data[name]))
+        grand_company = data['grand_company']
+        self.grand_company = grand_company and tuple(intern_name(x) for x in grand_company)
+
+        # Sections scrape_character was told to skip stay None
+        classes = data.get('classes')
+        self.classes = classes and dict((intern_name(name), ClassJob.from_dict(job))
+                                        for name, job in classes.items())
+        stats = data.get('stats')
+        self.stats = stats and dict((intern_name(name), value) for name, value in stats.items())
+        minions = data.get('minions')
+        self.minions = minions and [intern_name(x) for x in minions]
+        mounts = data.get('mounts')
+        self.mounts = mounts and [intern_name(x) for x in mounts]
+        equipment = data.get('current_equipment')
+        self.current_equipment = equipment and [Equipment.from_dict(x) for x in equipment]
+        achievements = data.get('achievements')
+        self.achievements = achievements and dict((achievement_id, Achievement.from_dict(achievement))
+                                                  for achievement_id, achievement in achievements.items())
+        return self
+
+    def to_dict(self):
+        data = dict((name, getattr(self, name)) for name in self.__slots__
+                    if name not in CHARACTER_SECTIONS)
+        if self.grand_company is not None:
+            data['grand_company'] = list(self.grand_company)
+        if self.classes is not None:
+            data['classes'] = dict((name, job.to_dict()) for name, job in self.classes.items())
+        if self.stats is not None:
+            data['stats'] = dict(self.stats)
+        if self.minions is not None:
+            data['minions'] = list(self.minions)
+        if self.mounts is not None:
+            data['mounts'] = list(self.mounts)
+        if self.current_equipment is not None:
+            data['current_equipment'] = [x.to_dict() if x else {} for x in self.current_equipment]
+        if self.achievements is not None:
+            data['achievements'] = dict((achievement_id, achievement.to_dict())
+                                        for achievement_id, achievement in self.achievements.items())
+        return data
+
+
+class Member(Model):
+    __slots__ = ('name', 'lodestone_id', 'rank_id', 'rank_name')
+
+    def __init__(self, name, lodestone_id, rank_id, rank_name):
+        self.name = name
+        self.lodestone_id = lodestone_id
+        self.rank_id = rank_id
+        self.rank_name = intern_name(rank_name)
+
+    @property
+    def leader(self):
+        return self.rank_id == 0
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['name'], data['lodestone_id'], data['rank']['id'], data['rank']['name'])
+
+    def to_dict(self):
+        data = {
+            'name': self.name,
+            'lodestone_id': self.lodestone_id,
+            'rank': {'id': self.rank_id, 'name': self.rank_name},
+        }
+        if self.leader:
+            data['leader'] = True
+        return data
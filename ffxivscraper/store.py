@@ -0,0 +1,201 @@
+import sqlite3
+import time
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+
+def character_delta(old, new):
+    # What changed between two scrape_character results, {} when nothing did. Sections
+    # missing from new weren't scraped, so they aren't reported as removed.
+    if old is None:
+        return {'created': True}
+
+    delta = {}
+    changed = {}
+    for key, value in new.items():
+        if key == 'classes':
+            old_classes = old.get('classes') or {}
+            levels = dict((job, (old_classes[job]['level'] if job in old_classes else None, stats['level']))
+                          for job, stats in value.items()
+                          if job not in old_classes or old_classes[job]['level'] != stats['level'])
+            if levels:
+                delta['levels'] = levels
+        elif key == 'achievements':
+            achievements = sorted(set(value) - set(old.get('achievements') or {}))
+            if achievements:
+                delta['achievements'] = achievements
+        elif old.get(key) != value:
+            changed[key] = (old.get(key), value)
+    if changed:
+        delta['changed'] = changed
+    return delta
+
+
+def merge_character(old, new):
+    # The document kept for a character: sections new doesn't have are carried over, and
+    # achievements accumulate so incremental scrape_achievements results can be stored
+    if old is None:
+        return new
+    merged = dict(old)
+    merged.update(new)
+    if 'achievements' in new and old.get('achievements'):
+        achievements = dict(old['achievements'])
+        achievements.update(new['achievements'])
+        merged['achievements'] = achievements
+    return merged
+
+
+def free_company_delta(old, new):
+    # Roster joins, leaves and rank changes plus any other changed field, {} when nothing did
+    if old is None:
+        return {'created': True}
+
+    delta = {}
+    changed = dict((key, (old.get(key), value)) for key, value in new.items()
+                   if key != 'roster' and old.get(key) != value)
+    if changed:
+        delta['changed'] = changed
+
+    old_roster = dict((member['lodestone_id'], member) for member in old.get('roster', []))
+    roster = dict((member['lodestone_id'], member) for member in new.get('roster', []))
+    joined = sorted(set(roster) - set(old_roster))
+    left = sorted(set(old_roster) - set(roster))
+    ranks = dict((lodestone_id, (old_roster[lodestone_id]['rank']['name'], member['rank']['name']))
+                 for lodestone_id, member in roster.items()
+                 if lodestone_id in old_roster and old_roster[lodestone_id]['rank'] != member['rank'])
+    if joined:
+        delta['joined'] = joined
+    if left:
+        delta['left'] = left
+    if ranks:
+        delta['ranks'] = ranks
+    return delta
+
+
+class Store(object):
+    # SQLite file holding the latest scrape of each character and free company, keyed by
+    # lodestone id. Upserts report what changed since the stored copy and record when
+    # each id was last scraped, so stale() can pick what to refresh next.
+    kinds = {
+        'character': (character_delta, merge_character),
+        'free_company': (free_company_delta, lambda old, new: new),
+    }
+
+    # Ids per IN (...) query, below SQLite's default variable limit
+    chunk_size = 500
+
+    def __init__(self, path):
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        for kind in self.kinds:
+            self.db.execute('CREATE TABLE IF NOT EXISTS %s '
+                            '(lodestone_id TEXT PRIMARY KEY, data BLOB, scraped REAL, changed REAL)' % kind)
+            self.db.execute('CREATE INDEX IF NOT EXISTS %s_scraped ON %s (scraped)' % (kind, kind))
+        self.db.commit()
+
+    def _table(self, kind):
+        # kind ends up in SQL, so only the known tables get through
+        if kind not in self.kinds:
+            raise ValueError('Unknown kind %r, expected one of %s' % (kind, ', '.join(sorted(self.kinds))))
+        return kind
+
+    def get(self, kind, lodestone_id):
+        kind = self._table(kind)
+        row = self.db.execute('SELECT data FROM %s WHERE lodestone_id = ?' % kind,
+                              (str(lodestone_id),)).fetchone()
+        return pickle.loads(bytes(row[0])) if row is not None else None
+
+    def get_many(self, kind, lodestone_ids):
+        # {lodestone_id: data} for the ids that are stored
+        kind = self._table(kind)
+        lodestone_ids = [str(x) for x in lodestone_ids]
+        found = {}
+        for i in range(0, len(lodestone_ids), self.chunk_size):
+            chunk = lodestone_ids[i:i + self.chunk_size]
+            rows = self.db.execute('SELECT lodestone_id, data FROM %s WHERE lodestone_id IN (%s)'
+                                   % (kind, ','.join('?' * len(chunk))), chunk)
+            for lodestone_id, data in rows:
+                found[lodestone_id] = pickle.loads(bytes(data))
+        return found
+
+    def upsert(self, kind, items):
+        # items is (lodestone_id, data) pairs, data may also be an ffxivscraper.models
+        # object. Everything is written in one transaction; returns {lodestone_id: delta}.
+        delta_of, merge = self.kinds[self._table(kind)]
+        items = [(str(lodestone_id), data.to_dict() if hasattr(data, 'to_dict') else data)
+                 for lodestone_id, data in items]
+        stored = self.get_many(kind, [lodestone_id for lodestone_id, _ in items])
+
+        now = time.time()
+        deltas = {}
+        rows = []
+        for lodestone_id, data in items:
+            old = stored.get(lodestone_id)
+            delta = delta_of(old, data)
+            deltas[lodestone_id] = delta
+            merged = merge(old, data)
+            stored[lodestone_id] = merged
+            rows.append((lodestone_id, sqlite3.Binary(pickle.dumps(merged, pickle.HIGHEST_PROTOCOL)),
+                         now, now if delta else None, lodestone_id))
+
+        with self.db:
+            # changed keeps its old value when the scrape found nothing new
+            self.db.executemany('INSERT OR REPLACE INTO %s (lodestone_id, data, scraped, changed) '
+                                'VALUES (?, ?, ?, COALESCE(?, (SELECT changed FROM %s WHERE lodestone_id = ?)))'
+                                % (kind, kind), rows)
+        return deltas
+
+    def stale(self, kind, max_age, lodestone_ids=None, limit=None):
+        # Ids last scraped more than max_age seconds ago, oldest first. With lodestone_ids,
+        # only those are considered and ones never stored count as stale (listed first).
+        kind = self._table(kind)
+        cutoff = time.time() - max_age
+        if lodestone_ids is None:
+            rows = self.db.execute('SELECT lodestone_id FROM %s WHERE scraped < ? ORDER BY scraped LIMIT ?'
+                                   % kind, (cutoff, -1 if limit is None else limit))
+            return [row[0] for row in rows]
+
+        lodestone_ids = [str(x) for x in lodestone_ids]
+        scraped = {}
+        for i in range(0, len(lodestone_ids), self.chunk_size):
+            chunk = lodestone_ids[i:i + self.chunk_size]
+            scraped.update(self.db.execute('SELECT lodestone_id, scraped FROM %s WHERE lodestone_id IN (%s)'
+                                           % (kind, ','.join('?' * len(chunk))), chunk))
+        stale = sorted((scraped.get(lodestone_id, 0), lodestone_id) for lodestone_id in set(lodestone_ids)
+                       if scraped.get(lodestone_id, 0) < cutoff)
+        return [lodestone_id for _, lodestone_id in stale][:limit]
+
+    def changed_since(self, kind, since):
+        # Ids whose upsert reported a delta after the since timestamp
+        kind = self._table(kind)
+        rows = self.db.execute('SELECT lodestone_id FROM %s WHERE changed > ? ORDER BY changed' % kind, (since,))
+        return [row[0] for row in rows]
+
+    def character(self, lodestone_id):
+        return self.get('character', lodestone_id)
+
+    def free_company(self, lodestone_id):
+        return self.get('free_company', lodestone_id)
+
+    def upsert_characters(self, items):
+        return self.upsert('character', items)
+
+    def upsert_free_companies(self, items):
+        return self.upsert('free_company', items)
+
+    def stale_characters(self, max_age, lodestone_ids=None, limit=None):
+        return self.stale('character', max_age, lodestone_ids, limit)
+
+    def stale_free_companies(self, max_age, lodestone_ids=None, limit=None):
+        return self.stale('free_company', max_age, lodestone_ids, limit)
+
+    def characters_changed_since(self, since):
+        return self.changed_since('character', since)
+
+    def free_companies_changed_since(self, since):
+        return self.changed_since('free_company', since)
+
+    def close(self):
+        self.db.close()
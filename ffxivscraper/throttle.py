@@ -0,0 +1,121 @@
+import collections
+import time
+
+
+class TokenBucket(object):
+    # Allows rate requests/sec on average with bursts of up to burst requests
+    def __init__(self, rate, burst=None, clock=time.time):
+        self.rate = float(rate)
+        self.burst = burst or max(1, int(rate))
+        self.clock = clock
+        self.tokens = float(self.burst)
+        self.updated = clock()
+
+    def reserve(self):
+        # Takes a token and returns the seconds to wait before it may be used. Tokens
+        # go negative while callers queue up, so waits are handed out in order.
+        now = self.clock()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        if self.tokens >= 0:
+            return 0
+        return -self.tokens / self.rate
+
+
+class AdaptiveConcurrency(object):
+    # AIMD limit on requests in flight. The limit is halved when Lodestone throttles us
+    # (429/503, connection errors) or latency climbs past slow_factor times the usual,
+    # and grows by one after a limit's worth of healthy responses.
+    throttled_statuses = (429, 503)
+
+    def __init__(self, initial=5, minimum=1, maximum=20, slow_factor=3.0, cooldown=1.0, clock=time.time):
+        self.limit = initial
+        self.minimum = minimum
+        self.maximum = maximum
+        self.slow_factor = slow_factor
+        self.cooldown = cooldown
+        self.clock = clock
+
+        self.in_flight = 0
+        self.latency = None
+        self._healthy = 0
+        self._decreased = 0
+
+    def try_acquire(self):
+        if self.in_flight >= self.limit:
+            return False
+        self.in_flight += 1
+        return True
+
+    def cancel(self):
+        # The request never got an answer (killed greenlet, cancelled task), so it says
+        # nothing about Lodestone's health
+        self.in_flight -= 1
+
+    def release(self, status_code, elapsed):
+        self.in_flight -= 1
+
+        throttled = status_code is None or status_code in self.throttled_statuses
+        slow = self.latency is not None and elapsed > self.latency * self.slow_factor
+
+        if throttled or slow:
+            self._healthy = 0
+            # Everything already in flight reports the same trouble, only back off once for it
+            now = self.clock()
+            if now - self._decreased >= self.cooldown:
+                self.limit = max(self.minimum, self.limit // 2)
+                self._decreased = now
+        else:
+            self._healthy += 1
+            if self._healthy >= self.limit:
+                self.limit = min(self.maximum, self.limit + 1)
+                self._healthy = 0
+
+        if not throttled:
+            self.latency = elapsed if self.latency is None else 0.9 * self.latency + 0.1 * elapsed
+
+
+class Throttle(object):
+    # Shared by every request a Scraper makes. Either part can be turned off with None.
+    def __init__(self, rate=5, burst=None, concurrency=None):
+        self.bucket = TokenBucket(rate, burst) if rate else None
+        self.concurrency = AdaptiveConcurrency() if concurrency is None else concurrency or None
+        self._waiters = collections.deque()
+
+    def acquire(self, event):
+        # Takes a slot and returns None, or when every slot is busy queues and returns
+        # event() (a gevent or asyncio Event) to wait on. It's set once release or cancel
+        # has taken a slot on its behalf; waiters are served in the order they arrived.
+        if self.concurrency is None or (not self._waiters and self.concurrency.try_acquire()):
+            return None
+        waiter = event()
+        self._waiters.append(waiter)
+        return waiter
+
+    def abandon(self, waiter):
+        # For a waiter that stopped waiting (killed greenlet, cancelled task): leaves the
+        # queue, or gives back the slot it was handed in the meantime
+        try:
+            self._waiters.remove(waiter)
+        except ValueError:
+            self.cancel()
+
+    def delay(self):
+        # Seconds to wait before sending, once a slot is held
+        return self.bucket.reserve() if self.bucket is not None else 0
+
+    def release(self, status_code, elapsed):
+        if self.concurrency is not None:
+            self.concurrency.release(status_code, elapsed)
+            self._wake()
+
+    def cancel(self):
+        if self.concurrency is not None:
+            self.concurrency.cancel()
+            self._wake()
+
+    def _wake(self):
+        # Hands freed slots (or new ones, after the limit grew) to the longest waiting
+        while self._waiters and self.concurrency.try_acquire():
+            self._waiters.popleft().set()
@@ -21,6 +21,7 @@ setup(name='ffxivscraper',
       version=VERSION,
       packages=find_packages(),
       install_requires=required,
+      extras_require={'lxml': ['lxml'], 'async': ['aiohttp']},
       scripts=['lodestoner'],
       author='Stanislav Vishnevskiy',
       author_email='vishnevskiy@gmail.com',
@@ -0,0 +1,50 @@
+import json
+import os
+
+import requests
+from requests.adapters import BaseAdapter
+
+from ffxivscraper import FFXIvScraper
+
+# Pages in benchmarks/bench.py's record format, one set per scrape_* call in 'calls'
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+
+class PagesAdapter(BaseAdapter):
+    # Serves {url: (status, body)} in place of Lodestone, anything else is a 404
+    def __init__(self, pages):
+        super(PagesAdapter, self).__init__()
+        self.pages = pages
+        self.requested = []
+
+    def send(self, request, **kwargs):
+        self.requested.append(request.url)
+        status, body = self.pages.get(request.url, (404, b''))
+        r = requests.Response()
+        r.url = request.url
+        r.request = request
+        r.status_code = status
+        r._content = body
+        return r
+
+    def close(self):
+        pass
+
+
+def offline_scraper(pages, **kwargs):
+    s = FFXIvScraper(**kwargs)
+    adapter = PagesAdapter(pages)
+    s.s.mount('http://', adapter)
+    s.s.mount('https://', adapter)
+    return s, adapter
+
+
+def load_fixtures():
+    # Returns ({url: (status, body)}, calls)
+    with open(os.path.join(FIXTURES, 'manifest.json')) as f:
+        manifest = json.load(f)
+    pages = {}
+    for url, page in manifest['pages'].items():
+        with open(os.path.join(FIXTURES, page['file']), 'rb') as f:
+            pages[url] = (page['status'], f.read())
+    return pages, manifest['calls']
@@ -0,0 +1,28 @@
+import pytest
+
+from conftest import load_fixtures, offline_scraper
+
+PAGES, _ = load_fixtures()
+
+
+@pytest.mark.parametrize('since_id', [997, '997'])
+def test_incremental_sync_stops_at_known_achievement(since_id):
+    s, adapter = offline_scraper(PAGES)
+    achievements = s.scrape_achievements('1', since_id=since_id)
+    assert list(achievements) == [1000, 999, 998]
+    assert len(adapter.requested) == 1
+
+
+@pytest.mark.parametrize('since_date', [1999999700, '1999999700'])
+def test_incremental_sync_stops_at_known_date(since_date):
+    s, adapter = offline_scraper(PAGES)
+    achievements = s.scrape_achievements('1', since_date=since_date)
+    assert list(achievements) == [1000, 999, 998]
+    assert len(adapter.requested) == 1
+
+
+def test_incremental_sync_walks_pages_until_known_data():
+    s, adapter = offline_scraper(PAGES)
+    achievements = s.scrape_achievements('1', since_id=977)
+    assert len(achievements) == 23
+    assert len(adapter.requested) == 2
@@ -0,0 +1,25 @@
+from ffxivscraper.cache import MemoryCache, ResponseCache
+
+from conftest import load_fixtures, offline_scraper
+
+PAGES, _ = load_fixtures()
+
+
+def test_memory_cache_bounds_total_weight():
+    cache = MemoryCache(10, weigh=len)
+    cache.set('a', 'xxxx')
+    cache.set('b', 'xxxx')
+    cache.set('c', 'xxxx')
+    assert cache.get('a') is None
+    assert cache.weight == 8
+    cache.set('b', 'x')
+    assert cache.weight == 5
+
+
+def test_response_cache_memory_is_bounded_by_bytes():
+    cache = ResponseCache()
+    s, _ = offline_scraper(PAGES, cache=cache)
+    cache.memory.maxsize = len(PAGES['http://na.finalfantasyxiv.com/lodestone/character/1/'][1])
+    s.scrape_character('1')
+    assert cache.memory.weight <= cache.memory.maxsize
+    assert len(cache.memory) == 1
@@ -0,0 +1,20 @@
+import pytest
+
+from ffxivscraper import DoesNotExist, FREE_COMPANY_MISSING
+from ffxivscraper.throttle import AdaptiveConcurrency, Throttle
+
+from conftest import offline_scraper
+
+FC_URL = 'http://na.finalfantasyxiv.com/lodestone/freecompany/1/'
+MISSING = b'<html><body>' + FREE_COMPANY_MISSING + b' or is unavailable.</body></html>'
+
+
+def test_missing_free_company_leaves_no_throttle_slots_taken():
+    concurrency = AdaptiveConcurrency(initial=3)
+    s, _ = offline_scraper({FC_URL: (404, MISSING), FC_URL + 'member': (404, MISSING)},
+                           retries=0, throttle=Throttle(rate=10, burst=1, concurrency=concurrency))
+
+    for _ in range(3):
+        with pytest.raises(DoesNotExist):
+            s.scrape_free_company(1)
+        assert concurrency.in_flight == 0
@@ -0,0 +1,69 @@
+import gevent
+
+from ffxivscraper import FFXIvScraper
+
+from conftest import PagesAdapter, load_fixtures, offline_scraper
+
+URL = 'http://na.finalfantasyxiv.com/lodestone/topics/'
+
+
+class FlakyAdapter(PagesAdapter):
+    # Answers with each (status, body) in turn, repeating the last
+    def __init__(self, responses):
+        super(FlakyAdapter, self).__init__({})
+        self.responses = list(responses)
+
+    def send(self, request, **kwargs):
+        self.pages[request.url] = self.responses.pop(0) if len(self.responses) > 1 else self.responses[0]
+        return super(FlakyAdapter, self).send(request, **kwargs)
+
+
+def flaky_scraper(responses, **kwargs):
+    s = FFXIvScraper(backoff=0, **kwargs)
+    adapter = FlakyAdapter(responses)
+    s.s.mount('http://', adapter)
+    return s, adapter
+
+
+def test_connection_pool_covers_page_fan_out():
+    s = FFXIvScraper(pool_size=4, page_concurrency=2)
+    adapter = s.s.get_adapter(URL)
+    # 4 characters at once, each with its page and 2 achievement pages in flight
+    assert adapter._pool_maxsize == 12
+    # Anything beyond that waits for a connection rather than discarding one
+    assert adapter._pool_block
+
+
+def test_retries_until_success():
+    s, adapter = flaky_scraper([(503, b''), (503, b''), (200, b'ok')], retries=3)
+    r = s.make_request(URL)
+    assert r.status_code == 200
+    assert r.content == b'ok'
+    assert len(adapter.requested) == 3
+
+
+def test_gives_up_with_the_last_response():
+    s, adapter = flaky_scraper([(503, b'first'), (503, b'second'), (503, b'last')], retries=2)
+    r = s.make_request(URL)
+    assert r.status_code == 503
+    assert r.content == b'last'
+    assert len(adapter.requested) == 3
+
+
+def test_abandoned_scrape_characters_stops_fetching():
+    s, adapter = offline_scraper(load_fixtures()[0])
+    send = adapter.send
+
+    def slow_send(request, **kwargs):
+        gevent.sleep(0.01)
+        return send(request, **kwargs)
+    adapter.send = slow_send
+
+    results = s.scrape_characters(['1'] * 50, concurrency=2, include=['classes'])
+    lodestone_id, data = next(results)
+    assert data['name'] == 'Foo Bar'
+    results.close()
+
+    requested = len(adapter.requested)
+    gevent.sleep(0.1)
+    assert len(adapter.requested) == requested
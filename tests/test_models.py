@@ -0,0 +1,41 @@
+import copy
+
+from ffxivscraper.models import Character, Member
+
+from conftest import load_fixtures, offline_scraper
+
+PAGES, _ = load_fixtures()
+
+
+def test_character_round_trip():
+    s, _ = offline_scraper(PAGES)
+    data = s.scrape_character('1')
+    character = Character.from_dict(data)
+    assert character.classes['Paladin'].level == 50
+    assert character.to_dict() == data
+
+
+def test_partial_character_round_trip():
+    s, _ = offline_scraper(PAGES)
+    data = s.scrape_character('1', include=['classes'])
+    character = Character.from_dict(data)
+    assert character.achievements is None
+    assert character.to_dict() == data
+
+
+def test_empty_equipment_slots():
+    s, _ = offline_scraper(PAGES)
+    data = copy.deepcopy(s.scrape_character('1'))
+    data['current_equipment'].insert(0, {})
+    character = Character.from_dict(data)
+    assert character.current_equipment[0] is None
+    assert character.current_equipment[1].slot == 'Head'
+    assert character.to_dict() == data
+
+
+def test_member_round_trip():
+    s, _ = offline_scraper(PAGES)
+    roster = s.scrape_free_company('1')['roster']
+    members = [Member.from_dict(member) for member in roster]
+    assert [member.leader for member in members[:2]] == [True, False]
+    assert [member.to_dict() for member in members] == roster
@@ -0,0 +1,44 @@
+import pytest
+
+from conftest import load_fixtures, offline_scraper
+
+PAGES, CALLS = load_fixtures()
+
+
+def scrape(parser, method, args):
+    s, _ = offline_scraper(PAGES, parser=parser, retries=0)
+    return getattr(s, method)(*args)
+
+
+@pytest.mark.parametrize('method, args', CALLS, ids=[method for method, _ in CALLS])
+def test_lxml_matches_html_parser(method, args):
+    pytest.importorskip('lxml')
+    expected = scrape('html.parser', method, args)
+    assert expected
+    assert scrape('lxml', method, args) == expected
+
+
+def test_default_parser_prefers_lxml():
+    try:
+        import lxml
+        expected = 'lxml'
+    except ImportError:
+        expected = 'html.parser'
+    s, _ = offline_scraper(PAGES)
+    assert s.parser == expected
+
+
+def test_include_selects_sections():
+    s, adapter = offline_scraper(PAGES)
+    data = s.scrape_character('1', include=('classes', 'stats'))
+    assert 'classes' in data and 'stats' in data
+    assert 'minions' not in data and 'achievements' not in data
+    assert len(adapter.requested) == 1
+
+
+@pytest.mark.parametrize('include', ['classes', ['classes', 'jobs']])
+def test_include_rejects_unknown_sections(include):
+    s, adapter = offline_scraper(PAGES)
+    with pytest.raises(ValueError):
+        s.scrape_character('1', include=include)
+    assert adapter.requested == []
@@ -0,0 +1,53 @@
+import copy
+import time
+
+import pytest
+
+from ffxivscraper.store import Store
+
+from conftest import load_fixtures, offline_scraper
+
+PAGES, _ = load_fixtures()
+
+
+def test_upsert_reports_deltas_and_changed_ids():
+    s, _ = offline_scraper(PAGES)
+    character = s.scrape_character('1')
+    store = Store(':memory:')
+    assert store.upsert_characters([('1', character)]) == {'1': {'created': True}}
+
+    since = time.time()
+    assert store.upsert_characters([(1, character)]) == {'1': {}}
+    assert store.characters_changed_since(since) == []
+
+    levelled = copy.deepcopy(character)
+    levelled['classes']['Paladin']['level'] = 51
+    assert store.upsert_characters([('1', levelled)]) == {'1': {'levels': {'Paladin': (50, 51)}}}
+    assert store.characters_changed_since(since) == ['1']
+    assert store.free_companies_changed_since(since) == []
+
+
+def test_free_company_roster_changes():
+    s, _ = offline_scraper(PAGES)
+    free_company = s.scrape_free_company('1')
+    store = Store(':memory:')
+    store.upsert_free_companies([('1', free_company)])
+
+    left = free_company['roster'].pop()
+    assert store.upsert_free_companies([('1', free_company)]) == {'1': {'left': [left['lodestone_id']]}}
+
+
+def test_stale_lists_unknown_ids_first():
+    store = Store(':memory:')
+    store.upsert_characters([('1', {'name': 'A'})])
+    assert store.stale_characters(3600, ['1', '2']) == ['2']
+    assert store.stale_characters(-1) == ['1']
+
+
+def test_unknown_kind_is_rejected():
+    store = Store(':memory:')
+    for query in (lambda: store.get('character; DROP TABLE character', '1'),
+                  lambda: store.stale('nope', 0),
+                  lambda: store.changed_since('nope', 0)):
+        with pytest.raises(ValueError):
+            query()
@@ -0,0 +1,107 @@
+from gevent.event import Event
+from gevent.pool import Pool
+import gevent
+import pytest
+import requests
+
+from ffxivscraper.throttle import AdaptiveConcurrency, Throttle
+
+from conftest import offline_scraper
+
+URL = 'http://na.finalfantasyxiv.com/lodestone/topics/'
+
+
+def test_killed_waiters_release_their_slots():
+    concurrency = AdaptiveConcurrency(initial=3)
+    s, _ = offline_scraper({URL: (200, b'ok')}, retries=0,
+                           throttle=Throttle(rate=1, burst=1, concurrency=concurrency))
+
+    pool = Pool(6)
+    for _ in range(6):
+        pool.spawn(s.make_request, URL)
+    gevent.sleep(0.1)
+    # Two requests hold a slot while sleeping off their token bucket delay
+    assert concurrency.in_flight > 0
+
+    pool.kill()
+    assert concurrency.in_flight == 0
+    # Being killed isn't a sign of Lodestone struggling
+    assert concurrency.limit == 3
+
+
+def test_failed_request_releases_its_slot():
+    concurrency = AdaptiveConcurrency(initial=3)
+    s, _ = offline_scraper({}, retries=0, throttle=Throttle(rate=None, concurrency=concurrency))
+
+    def fail(*args, **kwargs):
+        raise ValueError()
+    s.s.get = fail
+
+    try:
+        s.make_request(URL)
+    except ValueError:
+        pass
+    assert concurrency.in_flight == 0
+    # Our own bug, not Lodestone struggling
+    assert concurrency.limit == 3
+
+
+def test_connection_error_backs_off():
+    concurrency = AdaptiveConcurrency(initial=4)
+    s, _ = offline_scraper({}, retries=0, throttle=Throttle(rate=None, concurrency=concurrency))
+
+    def fail(*args, **kwargs):
+        raise requests.ConnectionError()
+    s.s.get = fail
+
+    with pytest.raises(requests.ConnectionError):
+        s.make_request(URL)
+    assert concurrency.in_flight == 0
+    assert concurrency.limit == 2
+
+
+def test_waiters_are_served_in_order():
+    throttle = Throttle(rate=None, concurrency=AdaptiveConcurrency(initial=1, maximum=1))
+    assert throttle.acquire(Event) is None
+    first = throttle.acquire(Event)
+    second = throttle.acquire(Event)
+
+    throttle.release(200, 0.1)
+    assert first.is_set() and not second.is_set()
+    # A newcomer queues behind second rather than taking the slot second is waiting for
+    third = throttle.acquire(Event)
+    assert third is not None
+
+    throttle.cancel()
+    assert second.is_set() and not third.is_set()
+    throttle.abandon(third)
+    throttle.cancel()
+    assert throttle.concurrency.in_flight == 0
+
+
+def test_cancelled_async_waiters_release_their_slots():
+    pytest.importorskip('aiohttp')
+    import asyncio
+    from ffxivscraper.aio import AsyncFFXIvScraper
+
+    concurrency = AdaptiveConcurrency(initial=3)
+    throttle = Throttle(rate=1, burst=1, concurrency=concurrency)
+    throttle.bucket.reserve()  # everyone waits, nothing reaches the network
+
+    async def run():
+        s = AsyncFFXIvScraper(retries=0, throttle=throttle)
+        tasks = [asyncio.ensure_future(s.make_request(URL)) for _ in range(3)]
+        await asyncio.sleep(0.1)
+        assert concurrency.in_flight == 3
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await s.close()
+
+    loop = asyncio.new_event_loop()
+    try:
+        loop.run_until_complete(run())
+    finally:
+        loop.close()
+    assert concurrency.in_flight == 0
+    assert concurrency.limit == 3
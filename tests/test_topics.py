@@ -0,0 +1,49 @@
+import pytest
+import requests
+
+from conftest import load_fixtures, offline_scraper
+
+TOPICS_URL = 'http://na.finalfantasyxiv.com/lodestone/topics/'
+PAGES, _ = load_fixtures()
+
+
+def test_poll_topics_only_returns_new_topics():
+    s, _ = offline_scraper(PAGES)
+    assert [topic['id'] for topic in s.poll_topics(since_id='t1')] == ['t0']
+    # The page hasn't changed since
+    assert s.poll_topics() == []
+
+
+def test_poll_topics_retries_a_page_that_failed_to_parse():
+    s, _ = offline_scraper(PAGES)
+    parse_topics = s._parse_topics
+
+    def broken(*args):
+        raise ValueError()
+    s._parse_topics = broken
+    with pytest.raises(ValueError):
+        s.poll_topics()
+
+    s._parse_topics = parse_topics
+    assert len(s.poll_topics()) == 3
+
+
+def test_poll_topics_raises_on_error_responses():
+    s, _ = offline_scraper({TOPICS_URL: (503, b'')}, retries=0)
+    with pytest.raises(requests.HTTPError):
+        s.poll_topics()
+
+
+def test_poll_topics_accepts_numeric_ids():
+    page = (b'<html><body><ul class="topics_list">' + b''.join(
+        b'<li><div class="topics_list_inner"><a href="/lodestone/topics/detail/%d">Title</a></div>'
+        b'<script>ldst_strftime(150000000%d, "YMD")</script><div class="area_inner_cont">Body</div></li>'
+        % (topic_id, topic_id) for topic_id in (3, 2, 1)) + b'</ul></body></html>')
+    s, _ = offline_scraper({TOPICS_URL: (200, page)})
+    assert [topic['id'] for topic in s.poll_topics(since_id=2)] == ['3']
+
+
+@pytest.mark.parametrize('since_timestamp', [1499999990, '1499999990'])
+def test_poll_topics_since_timestamp(since_timestamp):
+    s, _ = offline_scraper(PAGES)
+    assert [topic['id'] for topic in s.poll_topics(since_timestamp=since_timestamp)] == ['t0']
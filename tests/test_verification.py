@@ -0,0 +1,46 @@
+from ffxivscraper.cache import NameCache, ResponseCache
+
+from conftest import load_fixtures, offline_scraper
+
+PAGES, _ = load_fixtures()
+
+
+def test_verify_characters_keeps_stdout_clean(capsys):
+    s, _ = offline_scraper(PAGES)
+    results = dict(s.verify_characters([
+        ('Ultros', 'Foo Bar', 'code123', '1'),
+        ('Ultros', 'Someone Else', 'code123', '1'),
+        ('Ultros', 'Foo Bar', 'wrong', '1'),
+    ]))
+    assert results == {
+        ('Ultros', 'Foo Bar', 'code123', '1'): '1',
+        ('Ultros', 'Someone Else', 'code123', '1'): False,
+        ('Ultros', 'Foo Bar', 'wrong', '1'): False,
+    }
+    assert capsys.readouterr().out == ''
+
+
+def test_verification_sees_a_freshly_edited_profile():
+    pages = dict(PAGES)
+    url = 'http://na.finalfantasyxiv.com/lodestone/character/1/'
+    status, body = pages[url]
+    pages[url] = (status, body.replace(b'code123', b'old intro'))
+    s, adapter = offline_scraper(pages, cache=ResponseCache())
+    assert s.verify_character('Ultros', 'Foo Bar', 'code123', '1') is False
+
+    # The user pastes the code into their profile and tries again
+    pages[url] = (status, body)
+    assert s.verify_character('Ultros', 'Foo Bar', 'code123', '1') == '1'
+    assert adapter.requested.count(url) == 2
+
+
+def test_search_skips_the_response_cache():
+    pages = dict(PAGES)
+    url = 'http://na.finalfantasyxiv.com/lodestone/character/?q=New+Person&worldname=Ultros'
+    s, _ = offline_scraper(pages, cache=ResponseCache(), name_cache=NameCache(negative_ttl=0))
+    pages[url] = (200, b'<html><body></body></html>')
+    assert s.validate_character('Ultros', 'New Person') is None
+
+    pages[url] = (200, b'<html><body><div class="player_name_area"><div class="player_name_gold">'
+                       b'<a href="/lodestone/character/5/">New Person</a></div></div></body></html>')
+    assert s.validate_character('Ultros', 'New Person') == {'lodestone_id': '5', 'name': 'New Person'}